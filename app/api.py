@@ -1,10 +1,23 @@
 import logging
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from app.transcription import transcribe_audio
-from app.summarization import summarize_text
-from app.database import save_report
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, Response
+from telegram import Update
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.jobs import scheduler, QueueFullError
+from app.pipeline import process_report, PipelineError
+from app.metrics import AUDIO_BYTES
+from app.database import search_reports
+from app.journal import create_job, create_jobs, delete_job, finish_job, load_job, unfinished_jobs
+from app.batch import batch_runner
+from app.storage import disk, scratch_file, remove_scratch, StorageFullError
+from app.transcription import WHISPER_FORMATS
+from config.settings import STREAM_AUDIO, WEBHOOK_SECRET
+from datetime import datetime
+from typing import List, Optional
 import os
-import uuid
+import asyncio
+import shutil
+import hmac
+import zipfile
 
 # Configure logging
 logging.basicConfig(
@@ -14,48 +27,254 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
+app.state.telegram = None  # The bot Application, set by main.py in webhook mode
+
+WEBHOOK_PATH = "/telegram/webhook"
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+AUDIO_EXTENSIONS = WHISPER_FORMATS | {".opus", ".aac", ".amr", ".wma"}  # Archive members taken as reports
+ARCHIVE_MEMBER_MAX_SIZE = 200 * 1024 * 1024  # Larger archive members are skipped
+REPORTS_MAX_PAGE = 100
+
+async def iter_upload(file: UploadFile):
+    """Yield an uploaded file in chunks instead of reading it into memory at once."""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        AUDIO_BYTES.labels("received").inc(len(chunk))
+        yield chunk
 
 @app.post("/transcribe")
 async def transcribe(file: UploadFile = File(...)):
     file_path = ""
     try:
         logger.info(f"Received file upload: {file.filename}")
+        if STREAM_AUDIO:
+            try:
+                return await scheduler.submit(0, process_report, 0, None, iter_upload(file))
+            except QueueFullError as e:
+                logger.warning(f"Rejecting upload: {str(e)}")
+                raise HTTPException(status_code=503, detail="Processing queue is full, retry later", headers={"Retry-After": "60"})
+            except PipelineError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
         # Save uploaded file
-        file_path = f"voices/{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-        os.makedirs("voices", exist_ok=True)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        await disk.check(file.size or 0)
+        file_path = scratch_file(os.path.splitext(file.filename)[1])
+        await asyncio.to_thread(save_upload, file.file, file_path)
         logger.info(f"File saved to {file_path}")
 
-        # Transcribe
-        logger.info("Starting transcription")
-        transcript = transcribe_audio(file_path)
-        if "error" in transcript.lower():
-            logger.error(f"Transcription failed: {transcript}")
-            raise HTTPException(status_code=500, detail=transcript)
-        logger.info(f"Transcription successful: {transcript}")
-
-        # Summarize
-        logger.info("Starting summarization")
-        summary = summarize_text(transcript)
-        if "error" in summary.lower():
-            logger.error(f"Summarization failed: {summary}")
-            raise HTTPException(status_code=500, detail=summary)
-        logger.info(f"Summarization successful: {summary}")
-
-        # Save to database
-        logger.info("Saving to database")
-        report_id = save_report(user_id=0, voice_file_path=file_path, transcript=transcript, summary=summary)
-        logger.info(f"Saved report with ID {report_id}")
+        job_id = await asyncio.to_thread(create_job, "api", 0, file_path)
+        try:
+            result = await scheduler.submit(0, process_upload_job, file_path, job_id)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting upload: {str(e)}")
+            await asyncio.to_thread(delete_job, job_id)
+            raise HTTPException(status_code=503, detail="Processing queue is full, retry later", headers={"Retry-After": "60"})
+        except PipelineError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return result
+    except StorageFullError as e:
+        logger.warning(f"Rejecting upload: {str(e)}")
+        remove_scratch(file_path)
+        raise HTTPException(status_code=503, detail="Server storage is full, retry later", headers={"Retry-After": "60"})
+    except HTTPException:
+        remove_scratch(file_path)
+        raise
+    except Exception as e:
+        logger.error(f"Error in /transcribe: {str(e)}", exc_info=True)
+        remove_scratch(file_path)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/batch")
+async def batch(files: List[UploadFile] = File(...), user_id: int = Form(0)):
+    """Queue many reports for background processing and return their job IDs at once.
 
+    Each upload is an audio file or a zip archive of them. Poll GET /jobs/{job_id}
+    for progress; reports are stored in bulk as they finish.
+    """
+    saved = []  # (filename, file_path)
+    try:
+        # Archive members are checked at their compressed size; audio barely compresses
+        await disk.check(sum(file.size or 0 for file in files))
+        skipped = []
+        for file in files:
+            if file.filename.lower().endswith(".zip"):
+                try:
+                    members, rejected = await asyncio.to_thread(extract_archive, file.file)
+                except zipfile.BadZipFile:
+                    logger.warning(f"Skipping invalid archive {file.filename}")
+                    skipped.append(file.filename)
+                    continue
+                saved.extend(members)
+                skipped.extend(f"{file.filename}/{name}" for name in rejected)
+            else:
+                extension = os.path.splitext(file.filename)[1].lower()
+                if extension not in AUDIO_EXTENSIONS:
+                    skipped.append(file.filename)
+                    continue
+                file_path = scratch_file(extension)
+                saved.append((file.filename, file_path))
+                await asyncio.to_thread(save_upload, file.file, file_path)
+
+        job_ids = await asyncio.to_thread(create_jobs, "batch", user_id, [file_path for name, file_path in saved])
+        batch_runner.notify()
+        logger.info(f"Queued {len(job_ids)} batch jobs, skipped {len(skipped)} files")
         return {
-            "report_id": report_id,
-            "transcript": transcript,
-            "summary": summary
+            "jobs": [{"job_id": job_id, "filename": name} for job_id, (name, file_path) in zip(job_ids, saved)],
+            "skipped": skipped
         }
+    except StorageFullError as e:
+        logger.warning(f"Rejecting batch: {str(e)}")
+        discard_uploads(saved)
+        raise HTTPException(status_code=503, detail="Server storage is full, retry later", headers={"Retry-After": "60"})
     except Exception as e:
-        logger.error(f"Error in /transcribe: {str(e)}", exc_info=True)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        logger.error(f"Error in /batch: {str(e)}", exc_info=True)
+        discard_uploads(saved)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    except asyncio.CancelledError:
+        discard_uploads(saved)  # Client went away mid-upload
+        raise
+
+def discard_uploads(saved):
+    """Remove the scratch directories of a batch that was not queued."""
+    for name, file_path in saved:
+        remove_scratch(file_path)
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Stage of a /batch or /transcribe job, with its report once finished."""
+    job = await asyncio.to_thread(load_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job_id,
+        "stage": job["stage"],
+        "report_id": job["report_id"],
+        "error": job["error"],
+        "transcript": job["transcript"],
+        "summary": job["summary"]
+    }
+
+@app.get("/reports")
+async def reports(
+    user_id: Optional[int] = None,
+    q: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=REPORTS_MAX_PAGE),
+    fields: str = "id,user_id,created_at,summary"
+):
+    """Search reports, newest first; pass next_cursor back as cursor for the following page.
+
+    q searches transcripts and summaries (Persian spelling variants are folded);
+    fields picks the returned columns.
+    """
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        found, next_cursor = await asyncio.to_thread(
+            search_reports, user_id, q, since, until, before, limit, [field.strip() for field in fields.split(",")]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in /reports: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    return {"reports": found, "next_cursor": encode_cursor(next_cursor) if next_cursor else None}
+
+def encode_cursor(position):
+    created_at, report_id = position
+    return f"{created_at.isoformat()}_{report_id}"
+
+def decode_cursor(cursor):
+    created_at, report_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(created_at), int(report_id)
+
+def save_upload(source, file_path):
+    """Copy an uploaded file object to file_path in chunks; returns the size."""
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(source, f, UPLOAD_CHUNK_SIZE)
+        size = f.tell()
+    AUDIO_BYTES.labels("received").inc(size)
+    return size
+
+def extract_archive(source):
+    """Save each audio file in a zip archive to a scratch directory of its own.
+
+    Returns ([(member name, file_path)], [skipped member names]). If extraction
+    fails partway, the members saved so far are removed before the error propagates.
+    """
+    saved, skipped = [], []
+    try:
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                extension = os.path.splitext(info.filename)[1].lower()
+                if extension not in AUDIO_EXTENSIONS or info.file_size > ARCHIVE_MEMBER_MAX_SIZE:
+                    skipped.append(info.filename)
+                    continue
+                file_path = scratch_file(extension)
+                saved.append((info.filename, file_path))
+                with archive.open(info) as member:
+                    save_upload(member, file_path)
+    except BaseException:
+        discard_uploads(saved)
+        raise
+    return saved, skipped
+
+async def process_upload_job(file_path, job_id):
+    """Run a journaled upload through the pipeline and record how it ended."""
+    try:
+        result = await process_report(0, file_path, job_id=job_id)
+    except Exception as e:
+        remove_scratch(file_path)
+        await asyncio.to_thread(finish_job, job_id, "failed", str(e))
+        raise
+    remove_scratch(file_path)
+    await asyncio.to_thread(finish_job, job_id)
+    return result
+
+async def resume_upload_jobs():
+    """Requeue saved uploads that were queued or in progress when the process stopped.
+
+    The original request is gone, but the report is still stored. Streamed
+    uploads are never written to disk, so they cannot be resumed.
+    """
+    for job in await asyncio.to_thread(unfinished_jobs, "api"):
+        if not (job["file_path"] and os.path.exists(job["file_path"])):
+            await asyncio.to_thread(finish_job, job["id"], "failed", "Uploaded file is missing")
+            continue
+        logger.info(f"Resuming upload job {job['id']} at stage {job['stage']}")
+        # Already accepted before the restart, so the queue limits do not apply
+        scheduler.resume(0, process_upload_job, job["file_path"], job["id"])
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    """Receive a Telegram update and acknowledge it at once; the bot handles it in the background."""
+    application = request.app.state.telegram
+    if application is None:
+        raise HTTPException(status_code=404, detail="Webhook mode is not enabled")
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(secret, WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except Exception as e:
+        logger.warning(f"Rejecting malformed webhook update: {str(e)}")
+        raise HTTPException(status_code=400, detail="Malformed update")
+    if update is None:
+        raise HTTPException(status_code=400, detail="Empty update")
+    await application.update_queue.put(update)
+    return Response(status_code=200)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage timings, queue depth, in-flight upstream calls, bytes and errors."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,193 @@
+import logging
+import io
+import os
+import sys
+import wave
+from array import array
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+WAV_HEADER_SIZE = 44
+SILENCE_SEARCH_SECONDS = 5  # How far back from a hard cut point to look for a pause
+ENERGY_WINDOW_MS = 20  # Window used when measuring loudness
+COPY_CHUNK_FRAMES = 16000 * 30  # Frames copied per read when writing segments
+VAD_FRAME_MS = 30  # Window classified as speech or silence
+VAD_NOISE_FACTOR = 4  # Speech is this many times the noise floor's energy (about 6dB)
+VAD_MIN_RMS = 100  # Windows quieter than this are never speech, whatever the noise floor
+VAD_MIN_SILENCE_MS = 700  # Shorter pauses are kept so speech keeps its rhythm
+VAD_PADDING_MS = 200  # Kept either side of speech so word onsets and endings survive
+
+def pcm_samples(data):
+    """Convert little-endian 16-bit PCM bytes into an array of samples."""
+    samples = array("h")
+    samples.frombytes(data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+def window_energies(samples, window):
+    """Sum of squares for each consecutive window of samples."""
+    return [
+        sum(s * s for s in samples[i:i + window])
+        for i in range(0, len(samples) - window + 1, window)
+    ]
+
+def quietest_sample(samples, sample_rate):
+    """Index of the centre of the quietest window in samples, or None if too short."""
+    window = max(1, sample_rate * ENERGY_WINDOW_MS // 1000)
+    energies = window_energies(samples, window)
+    if not energies:
+        return None
+    quietest = min(range(len(energies)), key=energies.__getitem__)
+    return quietest * window + window // 2
+
+def find_quiet_point(wav, start_frame, end_frame):
+    """Return the frame at the centre of the quietest window in [start_frame, end_frame)."""
+    wav.setpos(start_frame)
+    samples = pcm_samples(wav.readframes(end_frame - start_frame))
+    offset = quietest_sample(samples, wav.getframerate())
+    return end_frame if offset is None else start_frame + offset
+
+def find_quiet_cut(pcm, sample_rate, end=None):
+    """Byte offset of the quietest moment in the few seconds before end (default: all) of a mono 16-bit PCM buffer.
+
+    Only pcm[:end] is looked at, so the cut does not depend on how much
+    more audio happens to be buffered.
+    """
+    end = len(pcm) if end is None else min(end, len(pcm))
+    search_bytes = min(SILENCE_SEARCH_SECONDS * sample_rate, end // 4) * 2
+    search_start = (end - search_bytes) & ~1  # Keep sample alignment
+    offset = quietest_sample(pcm_samples(bytes(pcm[search_start:search_start + search_bytes])), sample_rate)
+    return end if offset is None else search_start + offset * 2
+
+def pcm_to_wav(pcm, sample_rate):
+    """Wrap mono 16-bit PCM bytes in a WAV header."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm)
+    return buffer.getvalue()
+
+def speech_regions(energies, window, sample_rate, total_frames):
+    """Merge windows louder than the noise floor into (start, end) frame ranges of speech.
+
+    The noise floor is the 10th percentile of window energy. Pauses shorter
+    than VAD_MIN_SILENCE_MS are bridged and each region is padded by
+    VAD_PADDING_MS. With no speech found, the whole audio is kept.
+    """
+    if not energies:
+        return [(0, total_frames)]
+    noise_floor = sorted(energies)[len(energies) // 10]
+    threshold = max(VAD_MIN_RMS * VAD_MIN_RMS * window, noise_floor * VAD_NOISE_FACTOR)
+    padding = sample_rate * VAD_PADDING_MS // 1000
+    min_silence = sample_rate * VAD_MIN_SILENCE_MS // 1000
+    regions = []
+    for index, energy in enumerate(energies):
+        if energy < threshold:
+            continue
+        start = max(0, index * window - padding)
+        end = min(total_frames, (index + 1) * window + padding)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions or [(0, total_frames)]
+
+def timestamp_map(regions):
+    """List (trimmed_frame, source_frame, frames) for each kept region, in order.
+
+    Maps a position in trimmed audio back to the original recording; every
+    trimmed_frame after the first is a join where silence was removed.
+    """
+    mapping = []
+    trimmed = 0
+    for start, end in regions:
+        mapping.append((trimmed, start, end - start))
+        trimmed += end - start
+    return mapping
+
+def speech_ratio(regions, total_frames):
+    return sum(end - start for start, end in regions) / total_frames if total_frames else 1.0
+
+def trim_silence_pcm(pcm, sample_rate):
+    """Drop non-speech from mono 16-bit PCM bytes; returns (speech_pcm, regions)."""
+    window = sample_rate * VAD_FRAME_MS // 1000
+    energies = window_energies(pcm_samples(pcm), window)
+    regions = speech_regions(energies, window, sample_rate, len(pcm) // 2)
+    return b"".join(pcm[start * 2:end * 2] for start, end in regions), regions
+
+def trim_silence(wav_path, out_path):
+    """Write the speech in a 16-bit mono WAV to out_path, dropping long pauses.
+
+    The input is read in blocks, so memory stays flat for long reports.
+    Returns (regions, total_frames) with regions as source frame ranges.
+    """
+    with wave.open(wav_path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        window = sample_rate * VAD_FRAME_MS // 1000
+        block = COPY_CHUNK_FRAMES - COPY_CHUNK_FRAMES % window  # Keep windows aligned across reads
+        total_frames = wav.getnframes()
+        energies = []
+        for start in range(0, total_frames, block):
+            energies.extend(window_energies(pcm_samples(wav.readframes(block)), window))
+        regions = speech_regions(energies, window, sample_rate, total_frames)
+        with wave.open(out_path, "wb") as out:
+            out.setparams(wav.getparams())
+            for start, end in regions:
+                wav.setpos(start)
+                remaining = end - start
+                while remaining > 0:
+                    out.writeframes(wav.readframes(min(remaining, COPY_CHUNK_FRAMES)))
+                    remaining -= COPY_CHUNK_FRAMES
+    return regions, total_frames
+
+def plan_cut_points(wav, max_bytes, joins=()):
+    """Compute segment boundaries (in frames) so every segment fits in max_bytes.
+
+    Boundaries are exact for 16-bit mono PCM. Each one is moved back to the
+    latest of joins (frames where trim_silence removed a pause) in the
+    preceding few seconds, or else to the quietest moment there, so words are
+    not cut in half.
+    """
+    frame_size = wav.getsampwidth() * wav.getnchannels()
+    max_frames = (max_bytes - WAV_HEADER_SIZE) // frame_size
+    total_frames = wav.getnframes()
+    search_frames = min(SILENCE_SEARCH_SECONDS * wav.getframerate(), max_frames // 2)
+
+    cuts = [0]
+    while total_frames - cuts[-1] > max_frames:
+        hard_end = cuts[-1] + max_frames
+        nearby = [join for join in joins if hard_end - search_frames <= join < hard_end]
+        cuts.append(max(nearby) if nearby else find_quiet_point(wav, hard_end - search_frames, hard_end))
+    cuts.append(total_frames)
+    return cuts
+
+def split_wav(wav_path, max_bytes, joins=()):
+    """Split a PCM WAV into segments no larger than max_bytes in a single read; see plan_cut_points.
+
+    Returns a list of (segment_path, segment_size) in playback order.
+    """
+    segments = []
+    with wave.open(wav_path, "rb") as wav:
+        cuts = plan_cut_points(wav, max_bytes, joins)
+        logger.info(f"Splitting {wav_path} at frames {cuts[1:-1]}")
+        for index, (start, end) in enumerate(zip(cuts, cuts[1:])):
+            segment_path = f"{wav_path[:-4]}_segment_{index}.wav"
+            wav.setpos(start)
+            with wave.open(segment_path, "wb") as out:
+                out.setparams(wav.getparams())
+                remaining = end - start
+                while remaining > 0:
+                    frames = wav.readframes(min(remaining, COPY_CHUNK_FRAMES))
+                    out.writeframes(frames)
+                    remaining -= COPY_CHUNK_FRAMES
+            segment_size = os.path.getsize(segment_path)
+            logger.info(f"Created segment: {segment_path}, size: {segment_size} bytes")
+            segments.append((segment_path, segment_size))
+    return segments
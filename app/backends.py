@@ -0,0 +1,175 @@
+import logging
+import asyncio
+import gc
+import threading
+from abc import ABC, abstractmethod
+from app.http_client import request_with_retry
+from app.metrics import timed, TRANSCRIPTION_FALLBACKS
+from config.settings import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, SEGMENT_MAX_RETRIES, TRANSCRIBE_BACKEND, API_FALLBACK_TIMEOUT,
+    LOCAL_WHISPER_MODEL, LOCAL_WHISPER_BATCH_SIZE, LOCAL_WHISPER_THREADS
+)
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+API_MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB safety margin
+LOCAL_CHUNK_SECONDS = 30  # Whisper's context window; longer audio is chunked and batched
+
+class TranscriptionBackend(ABC):
+    """Turns one audio segment into text.
+
+    transcribe() returns the transcript, or an error string starting with
+    "Transcription error:" like the rest of the pipeline.
+    """
+    name = "base"
+    max_file_size = None  # Largest segment accepted, None when unlimited
+
+    def preload(self):
+        """Load anything expensive up front; called once at startup."""
+
+    @abstractmethod
+    async def transcribe(self, name, data):
+        """Return the transcript of one segment of audio bytes; name is used for logging and its format."""
+
+class WhisperAPIBackend(TranscriptionBackend):
+    """OpenAI's hosted Whisper, rate limited and retried by the shared HTTP client."""
+    name = "api"
+    max_file_size = API_MAX_FILE_SIZE
+
+    async def transcribe(self, name, data):
+        try:
+            logger.info(f"Sending segment {name} to OpenAI Whisper API")
+            headers = {
+                "Authorization": f"Bearer {OPENAI_API_KEY}"
+            }
+            files = {"file": (name, data)}
+            form = {"model": "whisper-1", "language": "fa"}
+            with timed("whisper"):
+                response = await request_with_retry(
+                    "whisper", "POST",
+                    f"{OPENAI_BASE_URL}/audio/transcriptions",
+                    attempts=SEGMENT_MAX_RETRIES,
+                    headers=headers,
+                    files=files,
+                    data=form
+                )
+
+            if response.status_code == 200:
+                return response.json().get("text", "")
+            error = response.text
+            logger.error(f"OpenAI API error: {error}")
+            return f"Transcription error: {error}"
+
+        except Exception as e:
+            logger.error(f"Segment transcription error: {str(e)}", exc_info=True)
+            return f"Transcription error: {str(e)}"
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """Whisper run on the CPU with transformers, int8-quantized.
+
+    The model is loaded once and shared by every job. Its linear layers are
+    quantized in place as it loads, so memory peaks at the fp32 weights
+    (about 300MB for whisper-base, 1GB for whisper-small) rather than at
+    the fp32 and int8 copies together. Inference runs in a
+    worker thread, one segment at a time so memory stays bounded; within a
+    segment, 30-second chunks are decoded LOCAL_WHISPER_BATCH_SIZE at a time.
+    """
+    name = "local"
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.pipeline = None
+        self.load_lock = threading.Lock()
+        self.inference_lock = asyncio.Lock()
+
+    def preload(self):
+        self.load()
+
+    def load(self):
+        with self.load_lock:
+            if self.pipeline is None:
+                # Imported here so API-only deployments never pay for torch
+                import torch
+                from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+                logger.info(f"Loading local Whisper model {self.model_name}")
+                torch.set_num_threads(LOCAL_WHISPER_THREADS)
+                with timed("model_load"):
+                    processor = AutoProcessor.from_pretrained(self.model_name)
+                    model = AutoModelForSpeechSeq2Seq.from_pretrained(self.model_name, low_cpu_mem_usage=True)
+                    model.eval()
+                    # In place: each fp32 layer is freed as its int8 replacement is made
+                    torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+                    gc.collect()
+                    self.pipeline = pipeline(
+                        "automatic-speech-recognition",
+                        model=model,
+                        tokenizer=processor.tokenizer,
+                        feature_extractor=processor.feature_extractor,
+                        chunk_length_s=LOCAL_CHUNK_SECONDS,
+                        batch_size=LOCAL_WHISPER_BATCH_SIZE,
+                        device="cpu"
+                    )
+                logger.info(f"Local Whisper model {self.model_name} ready")
+            return self.pipeline
+
+    def run(self, data):
+        import torch
+
+        asr = self.load()
+        with torch.inference_mode():
+            result = asr(data, generate_kwargs={"language": "persian", "task": "transcribe"})
+        return result["text"].strip()
+
+    async def transcribe(self, name, data):
+        try:
+            async with self.inference_lock:
+                logger.info(f"Transcribing segment {name} with local Whisper")
+                with timed("local_whisper"):
+                    return await asyncio.to_thread(self.run, data)
+        except Exception as e:
+            logger.error(f"Local transcription error: {str(e)}", exc_info=True)
+            return f"Transcription error: {str(e)}"
+
+class FallbackBackend(TranscriptionBackend):
+    """Try the primary backend, and use the fallback when it fails or takes longer than timeout seconds."""
+    name = "fallback"
+
+    def __init__(self, primary, fallback, timeout):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.max_file_size = primary.max_file_size  # Segments must still suit the primary
+
+    def preload(self):
+        # The fallback is needed exactly when the primary is struggling, so have it ready
+        self.primary.preload()
+        self.fallback.preload()
+
+    async def transcribe(self, name, data):
+        try:
+            transcript = await asyncio.wait_for(self.primary.transcribe(name, data), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.primary.name} backend took over {self.timeout} seconds on {name}, using {self.fallback.name}")
+            TRANSCRIPTION_FALLBACKS.labels("timeout").inc()
+        else:
+            if "error" not in transcript.lower():
+                return transcript
+            logger.warning(f"{self.primary.name} backend failed on {name}, using {self.fallback.name}")
+            TRANSCRIPTION_FALLBACKS.labels("error").inc()
+        return await self.fallback.transcribe(name, data)
+
+def create_backend(kind):
+    if kind == "api":
+        return WhisperAPIBackend()
+    if kind == "local":
+        return LocalWhisperBackend(LOCAL_WHISPER_MODEL)
+    if kind == "api_with_local_fallback":
+        return FallbackBackend(WhisperAPIBackend(), LocalWhisperBackend(LOCAL_WHISPER_MODEL), API_FALLBACK_TIMEOUT)
+    raise ValueError(f"Unknown TRANSCRIBE_BACKEND: {kind}")
+
+backend = create_backend(TRANSCRIBE_BACKEND)
@@ -0,0 +1,111 @@
+import logging
+import asyncio
+from app.jobs import scheduler, QueueFullError
+from app.pipeline import process_report
+from app.database import save_reports
+from app.storage import remove_scratch
+from app.journal import finish_job, finish_stored_jobs, unfinished_jobs, summarized_jobs
+from app.metrics import timed
+from config.settings import BATCH_CONCURRENCY, BATCH_INSERT_SIZE, BATCH_FLUSH_INTERVAL
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+BATCH_QUEUE = "batch"  # Scheduler queue shared by all batch jobs, so live users keep their round-robin turn
+
+class BatchRunner:
+    """Feeds journaled batch jobs to the job workers and stores their reports in bulk.
+
+    The journal is the batch queue: jobs wait there as "queued", at most
+    `concurrency` of them are in the scheduler at a time, and finished ones
+    wait as "summarized" until `insert_size` of them (or whatever is ready
+    after BATCH_FLUSH_INTERVAL) are inserted in one statement. Jobs
+    interrupted by a restart are picked up again the same way.
+    """
+
+    def __init__(self, concurrency, insert_size):
+        self.concurrency = concurrency
+        self.insert_size = insert_size
+        self.active = set()  # Job IDs handed to the scheduler
+        self.ready = 0  # Jobs summarized since the last insert
+        self.wake = asyncio.Event()
+
+    def notify(self):
+        """Wake the runner after new batch jobs are journaled."""
+        self.wake.set()
+
+    async def run(self):
+        idle = False
+        while True:
+            try:
+                await self.fill()
+                if self.ready >= self.insert_size or (self.ready and not self.active) or idle:
+                    await self.flush()
+            except Exception as e:
+                logger.error(f"Batch runner error: {str(e)}", exc_info=True)
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), BATCH_FLUSH_INTERVAL)
+                idle = False
+            except asyncio.TimeoutError:
+                idle = True
+
+    async def fill(self):
+        free = self.concurrency - len(self.active)
+        if free <= 0:
+            return
+        jobs = await asyncio.to_thread(unfinished_jobs, "batch", free + len(self.active))
+        for job in jobs:
+            if len(self.active) >= self.concurrency:
+                break
+            if job["id"] in self.active:
+                continue
+            try:
+                future = scheduler.submit(BATCH_QUEUE, run_batch_job, job)
+            except QueueFullError as e:
+                logger.info(f"Job queue busy, batch job {job['id']} waits: {str(e)}")
+                break
+            self.active.add(job["id"])
+            future.add_done_callback(lambda future, job_id=job["id"]: self.done(job_id, future))
+
+    def done(self, job_id, future):
+        self.active.discard(job_id)
+        if not future.cancelled() and future.result():
+            self.ready += 1
+        self.wake.set()
+
+    async def flush(self):
+        """Insert every summarized batch report, insert_size rows per statement."""
+        while True:
+            jobs = await asyncio.to_thread(summarized_jobs, "batch", self.insert_size)
+            if not jobs:
+                self.ready = 0
+                return
+            rows = [(job["user_id"], job["file_path"], job["transcript"], job["summary"]) for job in jobs]
+            with timed("db_write"):
+                report_ids = await asyncio.to_thread(save_reports, rows)
+            await asyncio.to_thread(finish_stored_jobs, {job["id"]: report_id for job, report_id in zip(jobs, report_ids)})
+            logger.info(f"Stored {len(jobs)} batch reports")
+            self.ready = max(0, self.ready - len(jobs))
+
+async def run_batch_job(job):
+    """Transcribe and summarize one batch job, leaving the report for the next bulk insert.
+
+    Returns True on success; failures are recorded in the journal.
+    """
+    logger.info(f"Processing batch job {job['id']} ({job['file_path']})")
+    try:
+        await process_report(job["user_id"], job["file_path"], job_id=job["id"], store=False)
+    except Exception as e:
+        logger.error(f"Batch job {job['id']} failed: {str(e)}")
+        remove_scratch(job["file_path"])
+        await asyncio.to_thread(finish_job, job["id"], "failed", str(e))
+        return False
+    # Not on cancellation: a job interrupted by shutdown needs its files when resumed
+    remove_scratch(job["file_path"])
+    return True
+
+batch_runner = BatchRunner(BATCH_CONCURRENCY, BATCH_INSERT_SIZE)
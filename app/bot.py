@@ -1,15 +1,25 @@
 import logging
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from config.settings import TELEGRAM_BOT_TOKEN
-from app.transcription import transcribe_audio
-from app.summarization import summarize_text
-from app.database import save_report
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import (
+    Application, BaseUpdateProcessor, CallbackContext, CommandHandler, MessageHandler, filters, ContextTypes
+)
+from config.settings import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_BASE_URL, TELEGRAM_FILE_BASE_URL, STREAM_AUDIO, SUMMARY_EDIT_INTERVAL,
+    UPDATE_CONCURRENCY
+)
+from app.jobs import scheduler, QueueFullError
+from app.http_client import get_client
+from app.metrics import timed, AUDIO_BYTES
+from app.pipeline import process_report, cached_report, PipelineError
+from app.database import search_reports
+from app.journal import create_job, delete_job, load_job, update_job, finish_job, unfinished_jobs
+from app.storage import disk, scratch_file, remove_scratch, StorageFullError
 import os
-import uuid
 import asyncio
 import re
 import time
+import json
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -17,8 +27,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-transcription_lock = asyncio.Lock()
 TELEGRAM_FILE_SIZE_LIMIT = 20 * 1024 * 1024  # 20 MB limit for getFile
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SUMMARY_PIECE_LENGTH = 1900  # Raw characters per message; escaping can double the length up to Telegram's 4096
+SEARCH_RESULTS = 5  # Reports listed per /search reply
+SEARCH_SNIPPET_LENGTH = 300  # Summary characters shown per result
 
 def escape_markdown_v2(text):
     """Escape special characters for Telegram MarkdownV2."""
@@ -30,6 +43,34 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received /start command from user {user_id}")
     await update.message.reply_text("لطفاً یک پیام صوتی یا فایل صوتی ارسال کنید تا آن را خلاصه کنم\\!", parse_mode="MarkdownV2")
 
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search <text>: the user's most recent reports mentioning text."""
+    user_id = update.message.from_user.id
+    query = " ".join(context.args).strip()
+    logger.info(f"Received /search command from user {user_id}: {query}")
+    if not query:
+        await update.message.reply_text("لطفاً عبارت جستجو را بعد از /search بنویسید\\.", parse_mode="MarkdownV2")
+        return
+    try:
+        found, next_cursor = await asyncio.to_thread(
+            search_reports, user_id, query, limit=SEARCH_RESULTS, columns=("summary",)
+        )
+    except Exception as e:
+        logger.error(f"Error in search: {str(e)}", exc_info=True)
+        await update.message.reply_text(f"⚠️ خطا: {escape_markdown_v2(str(e))}", parse_mode="MarkdownV2")
+        return
+    if not found:
+        await update.message.reply_text("🔎 گزارشی با این عبارت یافت نشد\\.", parse_mode="MarkdownV2")
+        return
+    lines = [f"🔎 نتایج جستجو برای «{escape_markdown_v2(query)}»:"]
+    for report in found:
+        summary = report["summary"] or ""
+        snippet = summary[:SEARCH_SNIPPET_LENGTH] + ("…" if len(summary) > SEARCH_SNIPPET_LENGTH else "")
+        lines.append(f"\n📅 {escape_markdown_v2(report['created_at'].strftime('%Y-%m-%d %H:%M'))}\n{escape_markdown_v2(snippet)}")
+    if next_cursor:
+        lines.append(f"\n\\(فقط {SEARCH_RESULTS} گزارش اخیر نمایش داده شد\\)")
+    await update.message.reply_text("\n".join(lines), parse_mode="MarkdownV2")
+
 async def handle_voice_or_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = update.message.from_user.id
@@ -58,66 +99,301 @@ async def handle_voice_or_audio(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return
 
-        logger.info("Downloading audio file")
-        file = await context.bot.get_file(audio_obj.file_id)
-        # Determine file extension dynamically
-        file_extension = os.path.splitext(file.file_path)[1] if file.file_path else ".ogg"
-        if not file_extension:
-            file_extension = ".ogg"  # Default to .ogg if unknown
-        file_path = f"voices/{uuid.uuid4()}{file_extension}"
-        os.makedirs("voices", exist_ok=True)
+        cached = await cached_report(user_id, audio_obj.file_unique_id)
+        if cached:
+            logger.info(f"Serving cached summary for file {audio_obj.file_unique_id}")
+            with timed("telegram_reply"):
+                await send_summary(update, cached["summary"])
+            return
+
+        waiting = scheduler.queued
+        # Journaled before queueing so the report survives a restart while it waits
+        job_id = await asyncio.to_thread(create_job, "telegram", user_id, update_json=update.to_json())
         try:
-            await file.download_to_drive(file_path)
-            logger.info(f"Audio file saved to {file_path}, size: {os.path.getsize(file_path)} bytes")
-        except Exception as e:
-            logger.error(f"Failed to download audio file: {str(e)}")
-            await update.message.reply_text(f"⚠️ خطا در دانلود فایل صوتی: {escape_markdown_v2(str(e))}", parse_mode="MarkdownV2")
+            scheduler.submit(user_id, process_voice_job, update, context, audio_obj, time.time(), job_id)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting report from user {user_id}: {str(e)}")
+            await asyncio.to_thread(delete_job, job_id)
+            await update.message.reply_text(
+                "⏳ صف پردازش در حال حاضر پر است\\. لطفاً چند دقیقه دیگر دوباره ارسال کنید\\.",
+                parse_mode="MarkdownV2"
+            )
             return
+        if scheduler.running + waiting >= scheduler.concurrency:
+            # All workers are busy, let the user know the report is waiting
+            await update.message.reply_text(
+                f"⏳ گزارش شما در صف پردازش قرار گرفت \\({waiting} گزارش جلوتر از شما\\)\\.",
+                parse_mode="MarkdownV2"
+            )
 
+    except Exception as e:
+        logger.error(f"Error in handle_voice_or_audio: {str(e)}", exc_info=True)
+        await update.message.reply_text(f"⚠️ خطا: {escape_markdown_v2(str(e))}", parse_mode="MarkdownV2")
+
+async def process_voice_job(update: Update, context: ContextTypes.DEFAULT_TYPE, audio_obj, queued_at, job_id=None):
+    """Download and process one voice report; runs on a scheduler worker.
+
+    A job resumed after a restart reuses its journaled progress message and
+    downloaded file, and skips the download entirely once it has a transcript.
+    """
+    user_id = update.message.from_user.id
+    file_path = None
+    report = ReportMessage(update, job_id)
+    try:
+        logger.info(f"Started job for user {user_id}, waited {time.time() - queued_at:.2f} seconds in queue")
         start_time = time.time()
-        async with transcription_lock:
-            logger.info(f"Acquired lock for user {user_id}, waited {time.time() - start_time:.2f} seconds")
-            logger.info("Starting transcription")
-            transcript = transcribe_audio(file_path)
-            if "error" in transcript.lower():
-                logger.error(f"Transcription failed: {transcript}")
-                await update.message.reply_text(f"⚠️ خطا در پردازش فایل صوتی: {escape_markdown_v2(transcript)}", parse_mode="MarkdownV2")
-                os.remove(file_path)
-                return
-            logger.info(f"Transcription successful: {transcript}")
-
-        logger.info("Starting summarization")
-        summary = summarize_text(transcript)
-        if "error" in summary.lower():
-            logger.error(f"Summarization failed: {summary}")
-            await update.message.reply_text(f"⚠️ خطا در خلاصه‌سازی: {escape_markdown_v2(summary)}", parse_mode="MarkdownV2")
-            os.remove(file_path)
+        job = await asyncio.to_thread(load_job, job_id) if job_id else None
+        if job and job["progress_message"]:
+            report.message = Message.de_json(json.loads(job["progress_message"]), context.bot)
+
+        chunks = None
+        if job and job["file_path"] and os.path.exists(job["file_path"]):
+            file_path = job["file_path"]
+            logger.info(f"Reusing downloaded file {file_path}")
+        elif not (job and job["transcript"] is not None):
+            await report.stage("download")
+            file = await context.bot.get_file(audio_obj.file_id)
+            if STREAM_AUDIO:
+                logger.info("Streaming audio file into the pipeline")
+                chunks = stream_telegram_file(file)
+            else:
+                file_path = await download_voice_file(report, file)
+                if file_path is None:
+                    await asyncio.to_thread(finish_job, job_id, "failed", "Download failed")
+                    return
+                await asyncio.to_thread(update_job, job_id, file_path=file_path)
+
+        try:
+            result = await process_report(user_id, file_path, chunks, audio_obj.file_unique_id, report, job_id)
+        except PipelineError as e:
+            if e.stage == "transcription":
+                await report.show(f"⚠️ خطا در پردازش فایل صوتی: {escape_markdown_v2(str(e))}")
+            else:
+                await report.show(f"⚠️ خطا در خلاصه‌سازی: {escape_markdown_v2(str(e))}")
+            remove_scratch(file_path)
+            await asyncio.to_thread(finish_job, job_id, "failed", str(e))
             return
-        logger.info(f"Summarization successful: {summary}")
 
-        logger.info("Saving to database")
-        report_id = save_report(user_id, file_path, transcript, summary)
-        logger.info(f"Saved report with ID {report_id}")
+        remove_scratch(file_path)
+        with timed("telegram_reply"):
+            await report.summary(result["summary"])
+        await asyncio.to_thread(finish_job, job_id)
+        logger.info(f"Sent summary to user {user_id}, processing time {time.time() - start_time:.2f} seconds")
+
+    except StorageFullError as e:
+        logger.warning(f"Dropping report from user {user_id}: {str(e)}")
+        await report.show("⏳ فضای ذخیره‌سازی سرور در حال حاضر پر است\\. لطفاً چند دقیقه دیگر دوباره ارسال کنید\\.")
+        remove_scratch(file_path)
+        await asyncio.to_thread(finish_job, job_id, "failed", str(e))
+    except Exception as e:
+        logger.error(f"Error in process_voice_job: {str(e)}", exc_info=True)
+        await report.show(f"⚠️ خطا: {escape_markdown_v2(str(e))}")
+        remove_scratch(file_path)
+        await asyncio.to_thread(finish_job, job_id, "failed", str(e))
 
-        escaped_summary = escape_markdown_v2(summary)
-        response = f"**خلاصه گزارش**:\n{escaped_summary}"
-        await update.message.reply_text(response, parse_mode="MarkdownV2")
-        logger.info(f"Sent summary to user {user_id}, total time {time.time() - start_time:.2f} seconds")
+async def resume_voice_jobs(application: Application):
+    """Requeue Telegram reports that were queued or in progress when the process stopped."""
+    for job in await asyncio.to_thread(unfinished_jobs, "telegram"):
+        try:
+            update = Update.de_json(json.loads(job["update_json"]), application.bot)
+            context = CallbackContext.from_update(update, application)
+            audio_obj = update.message.voice or update.message.audio
+        except Exception as e:
+            logger.error(f"Could not resume job {job['id']}: {str(e)}")
+            await asyncio.to_thread(finish_job, job["id"], "failed", str(e))
+            await notify_lost_report(application, job)
+            continue
+        logger.info(f"Resuming job {job['id']} for user {job['user_id']} at stage {job['stage']}")
+        # Already accepted before the restart, so the queue limits do not apply
+        scheduler.resume(job["user_id"], process_voice_job, update, context, audio_obj, time.time(), job["id"])
 
+async def notify_lost_report(application: Application, job):
+    """Tell the sender that a journaled report could not be resumed and must be sent again."""
+    try:
+        chat_id = json.loads(job["update_json"])["message"]["chat"]["id"]
+    except (TypeError, ValueError, KeyError):
+        chat_id = job["user_id"]  # Private chats share the user's ID
+    try:
+        await application.bot.send_message(
+            chat_id,
+            "⚠️ پردازش گزارش صوتی شما پس از راه‌اندازی مجدد سرور ممکن نشد\\. لطفاً آن را دوباره ارسال کنید\\.",
+            parse_mode="MarkdownV2"
+        )
     except Exception as e:
-        logger.error(f"Error in handle_voice_or_audio: {str(e)}", exc_info=True)
-        await update.message.reply_text(f"⚠️ خطا: {escape_markdown_v2(str(e))}", parse_mode="MarkdownV2")
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        logger.warning(f"Could not notify chat {chat_id} about job {job['id']}: {str(e)}")
+
+def format_summary(summary):
+    escaped_summary = escape_markdown_v2(summary)
+    return f"**خلاصه گزارش**:\n{escaped_summary}"
+
+def split_summary(summary):
+    """Split a summary into pieces that stay under Telegram's limit once escaped."""
+    pieces = []
+    while len(summary) > SUMMARY_PIECE_LENGTH:
+        cut = summary.rfind("\n", 0, SUMMARY_PIECE_LENGTH)
+        if cut <= 0:
+            cut = SUMMARY_PIECE_LENGTH
+        pieces.append(summary[:cut])
+        summary = summary[cut:].lstrip("\n")
+    pieces.append(summary)
+    return pieces
+
+async def send_summary(update: Update, summary):
+    pieces = split_summary(summary)
+    await update.message.reply_text(format_summary(pieces[0]), parse_mode="MarkdownV2")
+    for piece in pieces[1:]:
+        await update.message.reply_text(escape_markdown_v2(piece), parse_mode="MarkdownV2")
+
+class ReportMessage:
+    """A single reply that shows the report's progress and is then edited into its summary.
+
+    Partial summaries are throttled to one edit per SUMMARY_EDIT_INTERVAL to stay
+    within Telegram's edit limits; stage changes and the final summary always go out.
+    """
+
+    STAGES = {
+        "download": "⏳ در حال دریافت فایل صوتی\\.\\.\\.",
+        "transcription": "🎙️ در حال تبدیل گفتار به متن\\.\\.\\.",
+        "summarization": "📝 در حال خلاصه‌سازی\\.\\.\\.",
+    }
+
+    def __init__(self, update: Update, job_id=None):
+        self.update = update
+        self.job_id = job_id  # The reply is journaled so a resumed job keeps editing it
+        self.message = None
+        self.text = None
+        self.last_edit = 0
+
+    async def show(self, text, throttle=False):
+        """Send or edit the reply to text (already MarkdownV2-escaped)."""
+        if text == self.text:
+            return
+        now = time.monotonic()
+        if throttle and now - self.last_edit < SUMMARY_EDIT_INTERVAL:
+            return
+        try:
+            if self.message is None:
+                self.message = await self.update.message.reply_text(text, parse_mode="MarkdownV2")
+                if self.job_id:
+                    await asyncio.to_thread(update_job, self.job_id, progress_message=self.message.to_json())
+            else:
+                await self.message.edit_text(text, parse_mode="MarkdownV2")
+        except RetryAfter as e:
+            if throttle:
+                return  # A later edit will carry the text
+            await asyncio.sleep(e.retry_after)
+            return await self.show(text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self.text = text
+        self.last_edit = now
+
+    async def stage(self, stage):
+        await self.show(self.STAGES[stage])
+
+    async def segment_done(self, count):
+        await self.show(f"{self.STAGES['transcription']} \\({count} بخش انجام شد\\)", throttle=True)
+
+    async def partial_summary(self, summary):
+        preview = summary[:SUMMARY_PIECE_LENGTH]
+        await self.show(format_summary(preview) + " ⏳", throttle=True)
+
+    async def summary(self, summary):
+        pieces = split_summary(summary)
+        await self.show(format_summary(pieces[0]))
+        for piece in pieces[1:]:
+            await self.update.message.reply_text(escape_markdown_v2(piece), parse_mode="MarkdownV2")
+
+async def download_voice_file(report, file):
+    """Save a Telegram file in a new scratch directory; returns the path, or None after reporting the error.
+
+    Raises StorageFullError when the disk quota has no room for it.
+    """
+    logger.info("Downloading audio file")
+    await disk.check(file.file_size or 0)
+    # Determine file extension dynamically
+    file_extension = os.path.splitext(file.file_path)[1] if file.file_path else ".ogg"
+    if not file_extension:
+        file_extension = ".ogg"  # Default to .ogg if unknown
+    file_path = scratch_file(file_extension)
+    try:
+        with timed("download"):
+            await file.download_to_drive(file_path)
+        AUDIO_BYTES.labels("downloaded").inc(os.path.getsize(file_path))
+        logger.info(f"Audio file saved to {file_path}, size: {os.path.getsize(file_path)} bytes")
+        return file_path
+    except Exception as e:
+        logger.error(f"Failed to download audio file: {str(e)}")
+        remove_scratch(file_path)
+        await report.show(f"⚠️ خطا در دانلود فایل صوتی: {escape_markdown_v2(str(e))}")
+        return None
+
+async def stream_telegram_file(file):
+    """Yield the bytes of a Telegram file as they arrive, without saving it."""
+    async with get_client().stream("GET", file.file_path) as response:
+        if response.status_code != 200:
+            # Not raise_for_status(): its message contains the URL, which embeds the bot token
+            raise RuntimeError(f"Telegram file download failed with status {response.status_code}")
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            AUDIO_BYTES.labels("downloaded").inc(len(chunk))
+            yield chunk
 
 async def debug_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received update: {update.to_dict()}")  # Log only, no reply
 
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Handles up to max_concurrent_updates updates at once, but one at a time per chat.
+
+    Busy channels no longer wait behind each other, while replies within a
+    chat keep the order its messages arrived in. An update waits for its
+    chat before taking one of the max_concurrent_updates slots, so updates
+    queued behind a busy chat never hold a slot other chats could use.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.chat_locks = {}  # chat id -> (lock, updates holding or waiting for it)
+
+    async def process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        lock, users = self.chat_locks.get(chat.id, (asyncio.Lock(), 0))
+        self.chat_locks[chat.id] = (lock, users + 1)
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)  # Takes a slot
+        finally:
+            lock, users = self.chat_locks[chat.id]
+            if users == 1:
+                del self.chat_locks[chat.id]
+            else:
+                self.chat_locks[chat.id] = (lock, users - 1)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
 def setup_bot():
     logger.info("Setting up Telegram bot")
     try:
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        )
+        if TELEGRAM_BASE_URL:
+            builder = builder.base_url(TELEGRAM_BASE_URL).base_file_url(TELEGRAM_FILE_BASE_URL)
+        application = builder.build()
         application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("search", search))
         # Handle both voice and audio messages
         application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_voice_or_audio))
         application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND & ~(filters.VOICE | filters.AUDIO), debug_update))
@@ -0,0 +1,90 @@
+import logging
+import hashlib
+import sqlite3
+import time
+from app.metrics import CACHE_LOOKUPS
+from config.settings import CACHE_PATH, CACHE_TTL_DAYS, CACHE_MAX_ENTRIES
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Results are cached by kind:
+#   "transcript": keyed on "telegram:<file_unique_id>" or "sha256:<audio hash>"
+#   "summary": keyed on summary_key(transcript), which includes the model and prompt
+
+def connect():
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at_idx ON cache (accessed_at);")
+    return conn
+
+def get_cached(kind, key):
+    """Return the cached value, or None when missing or older than CACHE_TTL_DAYS."""
+    try:
+        conn = connect()
+        with conn:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE kind = ? AND key = ? AND created_at > ?;",
+                (kind, key, time.time() - CACHE_TTL_DAYS * 86400)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE kind = ? AND key = ?;",
+                    (time.time(), kind, key)
+                )
+        conn.close()
+        if row:
+            logger.info(f"Cache hit for {kind} {key}")
+            CACHE_LOOKUPS.labels(kind, "hit").inc()
+            return row[0]
+        CACHE_LOOKUPS.labels(kind, "miss").inc()
+        return None
+    except sqlite3.Error as e:
+        logger.error(f"Cache read error: {str(e)}")
+        return None
+
+def put_cached(kind, key, value):
+    """Store a value, then drop expired entries and the least recently used beyond CACHE_MAX_ENTRIES."""
+    try:
+        now = time.time()
+        conn = connect()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO cache (kind, key, value, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?);
+            """, (kind, key, value, now, now))
+            conn.execute("DELETE FROM cache WHERE created_at <= ?;", (now - CACHE_TTL_DAYS * 86400,))
+            conn.execute("""
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                );
+            """, (CACHE_MAX_ENTRIES,))
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Cache write error: {str(e)}")
+
+def audio_hash(file_path):
+    """SHA-256 of an audio file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def summary_key(model, prompt, transcript):
+    """Cache key for a summary; changes whenever the model or prompt template changes."""
+    return hashlib.sha256(f"{model}\0{prompt}\0{transcript}".encode("utf-8")).hexdigest()
@@ -1,25 +1,118 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from config.settings import DATABASE_URL
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extensions import connection as BaseConnection
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+import threading
+from config.settings import DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX
 from datetime import datetime
 
+pool = None
+# ThreadedConnectionPool raises when exhausted; this makes callers wait for a free connection instead
+pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+# Persian text is written with Arabic variants of some letters, zero-width non-joiners and either digit set;
+# normalize_persian() folds them so "فولاد مبارکه" matches however a transcript spelled it
+PERSIAN_FOLD_FROM = "يىكةۀأإؤ\u200c٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹"
+PERSIAN_FOLD_TO = "ییکههااو 01234567890123456789"
+PERSIAN_DROP = "\u064b\u064c\u064d\u064e\u064f\u0650\u0651\u0652\u0640"  # Diacritics and tatweel
+REPORT_COLUMNS = ("id", "user_id", "voice_file_path", "transcript", "summary", "created_at")
+
+class ReportConnection(BaseConnection):
+    """Connection that remembers whether the insert statement is prepared on it."""
+    save_report_prepared = False
+
+def init_pool():
+    """Create the shared connection pool; called once at startup."""
+    global pool
+    if pool is None:
+        pool = ThreadedConnectionPool(
+            DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL,
+            connection_factory=ReportConnection,
+            keepalives=1, keepalives_idle=30  # Keep idle pooled connections alive through the managed DB's firewall
+        )
+        print(f"Database pool created ({DB_POOL_MIN}-{DB_POOL_MAX} connections).")
+
+def close_pool():
+    global pool
+    if pool is not None:
+        pool.closeall()
+        pool = None
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection, discarding it if the server dropped it."""
+    if pool is None:
+        init_pool()
+    with pool_slots:
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=broken or conn.closed != 0)
+
 def init_db():
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS reports (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                voice_file_path VARCHAR(255),
-                transcript TEXT,
-                summary TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reports (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    voice_file_path VARCHAR(255),
+                    transcript TEXT,
+                    summary TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            # Keyset pagination walks (created_at, id) newest first, per user or across all reports
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS reports_user_id_created_at_id_idx
+                ON reports (user_id, created_at DESC, id DESC);
+            """)
+            cursor.execute("DROP INDEX IF EXISTS reports_user_id_created_at_idx;")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS reports_created_at_id_idx
+                ON reports (created_at DESC, id DESC);
+            """)
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION normalize_persian(value TEXT) RETURNS TEXT
+                LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                    SELECT translate(lower(coalesce(value, '')), %s, %s)
+                $$;
+            """, (PERSIAN_FOLD_FROM + PERSIAN_DROP, PERSIAN_FOLD_TO))
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION report_search_text(transcript TEXT, summary TEXT) RETURNS TEXT
+                LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                    SELECT normalize_persian(transcript) || ' ' || normalize_persian(summary)
+                $$;
+            """)
+            # 'simple' config: no Persian stemmer exists, and tickers must match as written
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS reports_search_tsv_idx ON reports
+                USING GIN (to_tsvector('simple', report_search_text(transcript, summary)));
+            """)
+            conn.commit()
+            try:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS reports_search_trgm_idx ON reports
+                    USING GIN (report_search_text(transcript, summary) gin_trgm_ops);
+                """)
+                conn.commit()
+            except psycopg2.Error as e:
+                # Search still works through the full-text index; partial-word matches just scan
+                conn.rollback()
+                print(f"Trigram index unavailable: {str(e)}")
+            cursor.close()
         print("Database initialized successfully.")
     except Exception as e:
         print(f"Database initialization error: {str(e)}")
@@ -27,30 +120,99 @@ def init_db():
 
 def save_report(user_id, voice_file_path, transcript, summary):
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO reports (user_id, voice_file_path, transcript, summary)
-            VALUES (%s, %s, %s, %s) RETURNING id;
-        """, (user_id, voice_file_path, transcript, summary))
-        report_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if not conn.save_report_prepared:
+                cursor.execute("""
+                    PREPARE save_report (BIGINT, VARCHAR, TEXT, TEXT) AS
+                    INSERT INTO reports (user_id, voice_file_path, transcript, summary)
+                    VALUES ($1, $2, $3, $4) RETURNING id;
+                """)
+                conn.save_report_prepared = True
+            cursor.execute("EXECUTE save_report (%s, %s, %s, %s);", (user_id, voice_file_path, transcript, summary))
+            report_id = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
         return report_id
     except Exception as e:
         print(f"Save report error: {str(e)}")
         raise
 
-def get_reports_by_user(user_id):
+def save_reports(rows):
+    """Insert many (user_id, voice_file_path, transcript, summary) rows in one statement; returns their IDs in order."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            report_ids = [row[0] for row in execute_values(cursor, """
+                INSERT INTO reports (user_id, voice_file_path, transcript, summary)
+                VALUES %s RETURNING id;
+            """, rows, page_size=len(rows), fetch=True)]
+            conn.commit()
+            cursor.close()
+        return report_ids
+    except Exception as e:
+        print(f"Save reports error: {str(e)}")
+        raise
+
+def search_reports(user_id=None, query=None, since=None, until=None, before=None, limit=20,
+                   columns=("id", "user_id", "created_at", "summary")):
+    """Return a page of reports, newest first, and the cursor for the next page (None on the last).
+
+    query matches whole words and phrases through the full-text index, and
+    parts of words through the trigram index, over transcript and summary.
+    since/until bound created_at. before is the (created_at, id) cursor of
+    the previous page. Only the requested columns are fetched; id and
+    created_at are always included because the cursor needs them.
+    """
+    unknown = set(columns) - set(REPORT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown report columns: {', '.join(sorted(unknown))}")
+    columns = [column for column in REPORT_COLUMNS if column in columns or column in ("id", "created_at")]
+
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append(sql.SQL("user_id = %s"))
+        params.append(user_id)
+    if since is not None:
+        conditions.append(sql.SQL("created_at >= %s"))
+        params.append(since)
+    if until is not None:
+        conditions.append(sql.SQL("created_at < %s"))
+        params.append(until)
+    if before is not None:
+        conditions.append(sql.SQL("(created_at, id) < (%s, %s)"))
+        params.extend(before)
+    if query:
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conditions.append(sql.SQL("""(
+            to_tsvector('simple', report_search_text(transcript, summary))
+                @@ phraseto_tsquery('simple', normalize_persian(%s))
+            OR report_search_text(transcript, summary) LIKE normalize_persian(%s)
+        )"""))
+        params.extend([query, pattern])
+
+    statement = sql.SQL("SELECT {columns} FROM reports {where} ORDER BY created_at DESC, id DESC LIMIT %s;").format(
+        columns=sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+        where=sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    )
+    params.append(limit + 1)  # One extra row tells whether there is a next page
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT * FROM reports WHERE user_id = %s ORDER BY created_at DESC;", (user_id,))
-        reports = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return reports
+        with get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(statement, params)
+            reports = cursor.fetchall()
+            conn.commit()  # End the read transaction before the connection goes back to the pool
+            cursor.close()
+        next_cursor = None
+        if len(reports) > limit:
+            reports = reports[:limit]
+            next_cursor = (reports[-1]["created_at"], reports[-1]["id"])
+        return reports, next_cursor
     except Exception as e:
-        print(f"Get reports error: {str(e)}")
+        print(f"Search reports error: {str(e)}")
         raise
+
+def get_reports_by_user(user_id, limit=20, before=None):
+    """One page of a user's reports, newest first, and the cursor for the next page; see search_reports."""
+    return search_reports(user_id, before=before, limit=limit, columns=REPORT_COLUMNS)
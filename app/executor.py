@@ -0,0 +1,188 @@
+import logging
+import asyncio
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from app.metrics import timed, MEMORY_RESERVED
+from config.settings import CPU_WORKERS, FFMPEG_TIMEOUT, TASK_MEMORY_MB, MEMORY_RESERVE_MB, JOB_MEMORY_LIMIT_MB
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+MEMORY_POLL_INTERVAL = 1  # Seconds between /proc/meminfo checks while waiting for memory
+MB = 1024 * 1024
+
+def mem_available():
+    """Bytes of memory the kernel can hand out without swapping, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class MemoryGate:
+    """Admits memory-hungry work only while the server has room for it.
+
+    Each task declares an estimate; it starts once MemAvailable, less what
+    already-admitted tasks may still allocate, covers the estimate plus
+    MEMORY_RESERVE_MB for the bot, API and database. One task is always let
+    through so work cannot stall entirely.
+    """
+
+    def __init__(self, reserve):
+        self.reserve = reserve
+        self.reserved = 0
+        self.changed = asyncio.Event()
+
+    def fits(self, size):
+        if self.reserved == 0 or size == 0:
+            return True  # Nothing to wait for, e.g. work covered by its caller's reservation
+        available = mem_available()
+        return available is None or available - self.reserved >= size + self.reserve
+
+    @asynccontextmanager
+    async def admit(self, size):
+        if not self.fits(size):
+            logger.info(f"Waiting for {size // MB}MB of free memory ({self.reserved // MB}MB reserved)")
+            with timed("admission_wait"):
+                while not self.fits(size):
+                    self.changed.clear()
+                    try:
+                        await asyncio.wait_for(self.changed.wait(), MEMORY_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+        self.reserved += size
+        MEMORY_RESERVED.set(self.reserved)
+        try:
+            yield
+        finally:
+            self.reserved -= size
+            MEMORY_RESERVED.set(self.reserved)
+            self.changed.set()
+
+memory = MemoryGate(MEMORY_RESERVE_MB * MB)
+
+def address_space():
+    """Bytes of virtual memory this process has mapped."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def limit_memory(headroom=0):
+    """Cap this process's address space at JOB_MEMORY_LIMIT_MB beyond headroom bytes.
+
+    Past the cap allocations fail (MemoryError, or ffmpeg exiting with an
+    error) instead of the kernel swapping or OOM-killing the whole bot.
+    """
+    if JOB_MEMORY_LIMIT_MB:
+        limit = headroom + JOB_MEMORY_LIMIT_MB * MB
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+PRLIMIT = shutil.which("prlimit")  # util-linux; sets the cap on a child without running Python code in it
+
+if JOB_MEMORY_LIMIT_MB and PRLIMIT is None:
+    logger.warning("prlimit not found, ffmpeg runs without the JOB_MEMORY_LIMIT_MB cap")
+
+def limited(args):
+    """args wrapped to run under the JOB_MEMORY_LIMIT_MB address-space cap, see limit_memory.
+
+    preexec_fn would do the same, but it is unsafe in a process with threads
+    (asyncio.to_thread, torch): the child can deadlock before exec.
+    """
+    if not JOB_MEMORY_LIMIT_MB or PRLIMIT is None:
+        return list(args)
+    return [PRLIMIT, f"--as={JOB_MEMORY_LIMIT_MB * MB}", "--", *args]
+
+def limit_worker_memory():
+    # Workers are forked with the bot's address space already mapped; the budget is on top of that
+    limit_memory(address_space())
+
+pool = None
+
+def get_pool():
+    """The shared worker processes for CPU-bound audio work."""
+    global pool
+    if pool is None:
+        pool = ProcessPoolExecutor(
+            max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("fork"), initializer=limit_worker_memory
+        )
+        logger.info(f"Started process pool with {CPU_WORKERS} workers")
+    return pool
+
+def start_pool():
+    """Fork all workers now; call at startup, before any threads or models exist, so they stay small."""
+    for future in [get_pool().submit(os.getpid) for _ in range(CPU_WORKERS)]:
+        future.result()
+
+def shutdown_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+        pool = None
+
+def replace_pool(broken):
+    """Drop a pool whose worker died (OOM killer, RLIMIT_AS) so the next get_pool() starts a fresh one."""
+    global pool
+    if pool is broken:
+        pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+async def run_cpu(func, *args, memory_mb=TASK_MEMORY_MB):
+    """Run func(*args) in a worker process once there is memory for it; func must be picklable.
+
+    If a worker dies the pool is replaced and the task retried once.
+    """
+    async with memory.admit(memory_mb * MB):
+        loop = asyncio.get_running_loop()
+        current = get_pool()
+        try:
+            return await loop.run_in_executor(current, func, *args)
+        except BrokenProcessPool:
+            logger.warning(f"Worker process died running {func.__name__}, restarting the process pool")
+            replace_pool(current)
+        current = get_pool()
+        try:
+            return await loop.run_in_executor(current, func, *args)
+        except BrokenProcessPool:
+            logger.error(f"Worker process died again running {func.__name__}")
+            replace_pool(current)
+            raise
+
+async def run_process(args, timeout=FFMPEG_TIMEOUT, memory_mb=TASK_MEMORY_MB):
+    """Run a command without blocking the event loop and return its CompletedProcess (text output).
+
+    The command runs under the JOB_MEMORY_LIMIT_MB address-space cap. Raises
+    CalledProcessError on a non-zero exit and TimeoutExpired after timeout
+    seconds; on timeout or cancellation the process is killed.
+    """
+    async with memory.admit(memory_mb * MB):
+        process = await asyncio.create_subprocess_exec(
+            *limited(args), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{args[0]} timed out after {timeout} seconds")
+            raise subprocess.TimeoutExpired(args, timeout, stderr=f"{args[0]} timed out after {timeout} seconds")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+    stdout = stdout.decode(errors="replace")
+    stderr = stderr.decode(errors="replace")
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
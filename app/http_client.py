@@ -0,0 +1,136 @@
+import logging
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+import httpx
+from app.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_REQUESTS, UPSTREAM_ERRORS
+from config.settings import (
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_RETRIES,
+    WHISPER_REQUESTS_PER_MINUTE, OPENROUTER_REQUESTS_PER_MINUTE
+)
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1  # Seconds, doubled after each failed attempt
+RETRY_MAX_DELAY = 60
+
+class TokenBucket:
+    """Allows `rate` requests per minute with bursts of up to `rate` / 6 (ten seconds' worth)."""
+
+    def __init__(self, rate):
+        self.rate = rate / 60
+        self.capacity = max(1, rate / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+limiters = {
+    "whisper": TokenBucket(WHISPER_REQUESTS_PER_MINUTE),
+    "openrouter": TokenBucket(OPENROUTER_REQUESTS_PER_MINUTE),
+}
+
+client = None
+
+def get_client():
+    """The process-wide HTTP client; connections are kept alive and shared by all jobs."""
+    global client
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+        )
+    return client
+
+async def close_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+def record_response(upstream, response):
+    UPSTREAM_REQUESTS.labels(upstream, str(response.status_code)).inc()
+    if response.status_code >= 400:
+        UPSTREAM_ERRORS.labels(upstream, str(response.status_code)).inc()
+
+def retry_delay(response, attempt):
+    """Seconds to wait before the next attempt, honouring Retry-After when the server sends it."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(RETRY_MAX_DELAY, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                return min(RETRY_MAX_DELAY, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+
+async def request_with_retry(upstream, method, url, attempts=HTTP_MAX_RETRIES, **kwargs):
+    """Send a request through the upstream's rate limiter, retrying throttling, 5xx and network errors.
+
+    Returns the last response; raises the last transport error if no response was received.
+    """
+    for attempt in range(1, attempts + 1):
+        await limiters[upstream].acquire()
+        try:
+            with UPSTREAM_IN_FLIGHT.labels(upstream).track_inprogress():
+                response = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            UPSTREAM_ERRORS.labels(upstream, type(e).__name__).inc()
+            if attempt == attempts:
+                raise
+            delay = retry_delay(None, attempt)
+            logger.warning(f"{upstream} request failed ({type(e).__name__}), retry {attempt} in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+            continue
+        record_response(upstream, response)
+        if response.status_code not in RETRY_STATUSES or attempt == attempts:
+            return response
+        delay = retry_delay(response, attempt)
+        logger.warning(f"{upstream} returned {response.status_code}, retry {attempt} in {delay:.1f} seconds")
+        await asyncio.sleep(delay)
+
+@asynccontextmanager
+async def stream_with_retry(upstream, method, url, attempts=HTTP_MAX_RETRIES, **kwargs):
+    """Like request_with_retry, but yields a streaming response.
+
+    Retries only happen before the response is handed to the caller; once the
+    body is being read, errors propagate.
+    """
+    started = False
+    for attempt in range(1, attempts + 1):
+        await limiters[upstream].acquire()
+        try:
+            with UPSTREAM_IN_FLIGHT.labels(upstream).track_inprogress():
+                async with get_client().stream(method, url, **kwargs) as response:
+                    record_response(upstream, response)
+                    if response.status_code not in RETRY_STATUSES or attempt == attempts:
+                        started = True
+                        yield response
+                        return
+                    delay = retry_delay(response, attempt)
+                    logger.warning(f"{upstream} returned {response.status_code}, retry {attempt} in {delay:.1f} seconds")
+        except httpx.TransportError as e:
+            UPSTREAM_ERRORS.labels(upstream, type(e).__name__).inc()
+            if started or attempt == attempts:
+                raise
+            delay = retry_delay(None, attempt)
+            logger.warning(f"{upstream} request failed ({type(e).__name__}), retry {attempt} in {delay:.1f} seconds")
+        await asyncio.sleep(delay)
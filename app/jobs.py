@@ -0,0 +1,147 @@
+import logging
+import asyncio
+import time
+from collections import OrderedDict, deque
+from app.metrics import JOBS_QUEUED, JOBS_RUNNING, JOBS_TOTAL, STAGE_SECONDS
+from config.settings import JOB_CONCURRENCY, JOB_QUEUE_SIZE, JOB_MAX_PER_USER
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be accepted because the queue is at capacity."""
+
+class JobScheduler:
+    """Bounded job queue with a fixed worker pool and round-robin fairness across users.
+
+    Jobs are coroutine functions. Each user has their own FIFO; workers take one job
+    from each waiting user in turn, so a user posting many reports cannot starve others.
+    """
+
+    def __init__(self, concurrency, max_queued, max_per_user):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self._pending = OrderedDict()  # user_id -> deque of (func, args, future, queued_at)
+        self._queued = 0
+        self._running = 0
+        self._stopping = False  # Set while stop() cancels the workers
+        self._workers = []
+        self._available = None  # Counts queued jobs; workers acquire one per job
+
+    @property
+    def queued(self):
+        return self._queued
+
+    @property
+    def running(self):
+        return self._running
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._available = asyncio.Semaphore(0)
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        logger.info(f"Started {self.concurrency} job workers (queue size {self.max_queued})")
+
+    def submit(self, user_id, func, *args):
+        """Queue func(*args) for user_id and return a future for its result.
+
+        Raises QueueFullError when the global queue or the user's own queue is full.
+        """
+        self._ensure_workers()
+        user_queue = self._pending.get(user_id)
+        user_queued = len(user_queue) if user_queue else 0
+        if self._queued >= self.max_queued:
+            JOBS_TOTAL.labels("rejected").inc()
+            raise QueueFullError(f"Job queue is full ({self._queued} waiting)")
+        if user_queued >= self.max_per_user:
+            JOBS_TOTAL.labels("rejected").inc()
+            raise QueueFullError(f"User {user_id} already has {user_queued} jobs waiting")
+        return self._enqueue(user_id, func, args)
+
+    def resume(self, user_id, func, *args):
+        """Queue a job that was accepted before a restart, bypassing the queue limits.
+
+        The limits protect against new work; a resumed job was already
+        promised to its user, so it always gets back in line.
+        """
+        self._ensure_workers()
+        return self._enqueue(user_id, func, args)
+
+    def _enqueue(self, user_id, func, args):
+        future = asyncio.get_running_loop().create_future()
+        # Many callers fire and forget; the worker has logged any failure already
+        future.add_done_callback(retrieve_exception)
+        user_queue = self._pending.get(user_id)
+        if user_queue is None:
+            user_queue = self._pending[user_id] = deque()
+        user_queue.append((func, args, future, time.perf_counter()))
+        self._queued += 1
+        JOBS_QUEUED.set(self._queued)
+        logger.info(f"Queued job for user {user_id}, {self._queued} waiting, {self._running} running")
+        self._available.release()
+        return future
+
+    def _next_job(self):
+        user_id, user_queue = next(iter(self._pending.items()))
+        job = user_queue.popleft()
+        if user_queue:
+            self._pending.move_to_end(user_id)  # Round-robin to the next user
+        else:
+            del self._pending[user_id]
+        self._queued -= 1
+        JOBS_QUEUED.set(self._queued)
+        return user_id, job
+
+    async def _worker(self, worker_id):
+        while True:
+            await self._available.acquire()
+            user_id, (func, args, future, queued_at) = self._next_job()
+            if future.cancelled():
+                continue
+            STAGE_SECONDS.labels("queue_wait").observe(time.perf_counter() - queued_at)
+            self._running += 1
+            JOBS_RUNNING.set(self._running)
+            start = time.perf_counter()
+            logger.info(f"Worker {worker_id} running job for user {user_id}")
+            try:
+                result = await func(*args)
+                JOBS_TOTAL.labels("completed").inc()
+                if not future.cancelled():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                JOBS_TOTAL.labels("cancelled").inc()
+                if not future.done():
+                    future.cancel()
+                if self._stopping:
+                    raise  # The worker itself is being cancelled
+                logger.warning(f"Job for user {user_id} was cancelled")
+            except Exception as e:
+                logger.error(f"Job for user {user_id} failed: {str(e)}", exc_info=True)
+                JOBS_TOTAL.labels("failed").inc()
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                STAGE_SECONDS.labels("job_total").observe(time.perf_counter() - start)
+                self._running -= 1
+                JOBS_RUNNING.set(self._running)
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._stopping = False
+
+def retrieve_exception(future):
+    """Mark a job's exception as seen so asyncio does not report it as never retrieved."""
+    if not future.cancelled():
+        future.exception()
+
+scheduler = JobScheduler(JOB_CONCURRENCY, JOB_QUEUE_SIZE, JOB_MAX_PER_USER)
@@ -0,0 +1,212 @@
+import logging
+import sqlite3
+import time
+import uuid
+from config.settings import JOURNAL_PATH, JOURNAL_RETENTION_DAYS
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Stages a job moves through; "done" and "failed" are final, anything else is resumed after a restart:
+#   queued -> transcription -> summarization -> storing -> stored -> done
+# Batch jobs stop at "summarized" instead, and are stored in bulk by app/batch.py.
+JOB_FIELDS = ("stage", "transcript", "summary", "report_id", "file_path", "progress_message", "error")
+
+def connect():
+    conn = sqlite3.connect(JOURNAL_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL;")  # Committed writes survive a crash, readers do not block writers
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            update_json TEXT,
+            file_path TEXT,
+            progress_message TEXT,
+            transcript TEXT,
+            summary TEXT,
+            report_id INTEGER,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_stage_idx ON jobs (stage);
+        CREATE TABLE IF NOT EXISTS job_segments (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            transcript TEXT NOT NULL,
+            PRIMARY KEY (job_id, idx)
+        );
+        CREATE TABLE IF NOT EXISTS job_parts (
+            job_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (job_id, key)
+        );
+    """)
+    return conn
+
+def execute(sql, params=()):
+    try:
+        conn = connect()
+        with conn:
+            conn.execute(sql, params)
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Journal write error: {str(e)}")
+
+def execute_many(sql, rows):
+    try:
+        conn = connect()
+        with conn:
+            conn.executemany(sql, rows)
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Journal write error: {str(e)}")
+
+def create_job(kind, user_id, file_path=None, update_json=None):
+    """Record a new job before it is queued; kind is "telegram", "api" or "batch". Returns its ID."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    execute("""
+        INSERT INTO jobs (id, kind, user_id, stage, update_json, file_path, created_at, updated_at)
+        VALUES (?, ?, ?, 'queued', ?, ?, ?, ?);
+    """, (job_id, kind, user_id, update_json, file_path, now, now))
+    return job_id
+
+def create_jobs(kind, user_id, file_paths):
+    """Record a job for each file in one transaction; returns their IDs in order."""
+    job_ids = [uuid.uuid4().hex for _ in file_paths]
+    now = time.time()
+    execute_many("""
+        INSERT INTO jobs (id, kind, user_id, stage, file_path, created_at, updated_at)
+        VALUES (?, ?, ?, 'queued', ?, ?, ?);
+    """, [(job_id, kind, user_id, file_path, now, now) for job_id, file_path in zip(job_ids, file_paths)])
+    return job_ids
+
+def update_job(job_id, **fields):
+    """Save any of JOB_FIELDS for a job."""
+    unknown = set(fields) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {unknown}")
+    columns = "".join(f", {name} = ?" for name in fields)
+    execute(
+        f"UPDATE jobs SET updated_at = ?{columns} WHERE id = ?;",
+        (time.time(), *fields.values(), job_id)
+    )
+
+def set_stage(job_id, stage, **fields):
+    """Move a job to stage, saving any fields passed alongside."""
+    update_job(job_id, stage=stage, **fields)
+
+def save_segment(job_id, index, transcript):
+    execute("INSERT OR REPLACE INTO job_segments (job_id, idx, transcript) VALUES (?, ?, ?);", (job_id, index, transcript))
+
+def save_part(job_id, key, summary):
+    execute("INSERT OR REPLACE INTO job_parts (job_id, key, summary) VALUES (?, ?, ?);", (job_id, key, summary))
+
+def finish_job(job_id, stage="done", error=None):
+    """Mark a job done or failed and drop its intermediate results; old finished jobs are pruned."""
+    now = time.time()
+    try:
+        conn = connect()
+        with conn:
+            conn.execute("UPDATE jobs SET stage = ?, error = ?, updated_at = ? WHERE id = ?;", (stage, error, now, job_id))
+            conn.execute("DELETE FROM job_segments WHERE job_id = ?;", (job_id,))
+            conn.execute("DELETE FROM job_parts WHERE job_id = ?;", (job_id,))
+            conn.execute(
+                "DELETE FROM jobs WHERE stage IN ('done', 'failed') AND updated_at <= ?;",
+                (now - JOURNAL_RETENTION_DAYS * 86400,)
+            )
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Journal write error: {str(e)}")
+
+def finish_stored_jobs(report_ids):
+    """Mark many jobs done in one transaction; report_ids maps job ID to its report ID."""
+    now = time.time()
+    try:
+        conn = connect()
+        with conn:
+            conn.executemany(
+                "UPDATE jobs SET stage = 'done', report_id = ?, updated_at = ? WHERE id = ?;",
+                [(report_id, now, job_id) for job_id, report_id in report_ids.items()]
+            )
+            conn.executemany("DELETE FROM job_segments WHERE job_id = ?;", [(job_id,) for job_id in report_ids])
+            conn.executemany("DELETE FROM job_parts WHERE job_id = ?;", [(job_id,) for job_id in report_ids])
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Journal write error: {str(e)}")
+
+def delete_job(job_id):
+    execute("DELETE FROM jobs WHERE id = ?;", (job_id,))
+
+def load_job(job_id):
+    """Return a job as a dict with its saved segments ({index: transcript}) and parts ({key: summary}), or None."""
+    try:
+        conn = connect()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?;", (job_id,)).fetchone()
+        if row is None:
+            conn.close()
+            return None
+        job = dict(row)
+        job["segments"] = dict(conn.execute(
+            "SELECT idx, transcript FROM job_segments WHERE job_id = ?;", (job_id,)
+        ).fetchall())
+        job["parts"] = dict(conn.execute(
+            "SELECT key, summary FROM job_parts WHERE job_id = ?;", (job_id,)
+        ).fetchall())
+        conn.close()
+        return job
+    except sqlite3.Error as e:
+        logger.error(f"Journal read error: {str(e)}")
+        return None
+
+def unfinished_jobs(kind, limit=-1):
+    """Jobs of kind still to be processed (queued or interrupted), oldest first."""
+    try:
+        conn = connect()
+        rows = conn.execute(
+            "SELECT id, user_id, stage, update_json, file_path FROM jobs "
+            "WHERE kind = ? AND stage NOT IN ('done', 'failed', 'summarized') ORDER BY created_at LIMIT ?;",
+            (kind, limit)
+        ).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Journal read error: {str(e)}")
+        return []
+
+def summarized_jobs(kind, limit):
+    """Jobs of kind whose transcript and summary are ready to be stored, oldest first."""
+    try:
+        conn = connect()
+        rows = conn.execute(
+            "SELECT id, user_id, file_path, transcript, summary FROM jobs "
+            "WHERE kind = ? AND stage = 'summarized' ORDER BY created_at LIMIT ?;",
+            (kind, limit)
+        ).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Journal read error: {str(e)}")
+        return []
+
+def unfinished_files():
+    """Files of every job that may still be resumed, whatever its kind; None when the journal cannot be read."""
+    try:
+        conn = connect()
+        rows = conn.execute(
+            "SELECT file_path FROM jobs WHERE stage NOT IN ('done', 'failed') AND file_path IS NOT NULL;"
+        ).fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Journal read error: {str(e)}")
+        return None
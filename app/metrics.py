@@ -0,0 +1,36 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+# Buckets span a single Telegram edit (tens of ms) up to a 12-minute report end to end
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300, 600, 1200)
+
+STAGE_SECONDS = Histogram(
+    "voice_stage_seconds", "Time spent in each pipeline stage",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+JOBS_QUEUED = Gauge("voice_jobs_queued", "Reports waiting for a worker")
+JOBS_RUNNING = Gauge("voice_jobs_running", "Reports being processed")
+JOBS_TOTAL = Counter("voice_jobs_total", "Finished or refused reports", ["result"])
+AUDIO_BYTES = Counter("voice_audio_bytes_total", "Audio bytes processed", ["direction"])
+UPSTREAM_IN_FLIGHT = Gauge("voice_upstream_in_flight", "Requests in flight to each upstream API", ["upstream"])
+UPSTREAM_REQUESTS = Counter("voice_upstream_requests_total", "Upstream API responses", ["upstream", "status"])
+UPSTREAM_ERRORS = Counter("voice_upstream_errors_total", "Upstream API failures, including retried ones", ["upstream", "reason"])
+TRANSCRIPTION_FALLBACKS = Counter("voice_transcription_fallbacks_total", "Segments handed to the fallback backend", ["reason"])
+MEMORY_RESERVED = Gauge("voice_memory_reserved_bytes", "Memory set aside for admitted ffmpeg runs and CPU tasks")
+DISK_USED = Gauge("voice_disk_used_bytes", "Disk used by scratch directories and kept originals")
+DISK_RESERVED = Gauge("voice_disk_reserved_bytes", "Disk set aside for running transcriptions")
+SPEECH_RATIO = Histogram(
+    "voice_speech_ratio", "Share of each recording kept as speech by silence trimming",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1)
+)
+CACHE_LOOKUPS = Counter("voice_cache_lookups_total", "Result cache lookups", ["kind", "result"])
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the enclosed block under STAGE_SECONDS{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
@@ -0,0 +1,268 @@
+import logging
+import asyncio
+import hashlib
+import os
+from contextlib import aclosing
+from app.transcription import iter_transcript_segments, iter_stream_segments
+from app.summarization import (
+    summarize_text, summarize_text_streaming, summarize_part, join_part_summaries, split_transcript,
+    SUMMARY_MODEL, SUMMARY_PROMPT, PART_PROMPT
+)
+from app.database import save_report
+from app.cache import get_cached, put_cached, audio_hash, summary_key
+from app.journal import load_job, set_stage, save_segment, save_part
+from app.storage import disk, retain_original, SCRATCH_EXPANSION
+from app.metrics import timed
+from config.settings import STREAM_SUMMARY, SUMMARY_MODE, MAP_REDUCE_MIN_CHARS, SUMMARY_CHUNK_CHARS
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+class PipelineError(Exception):
+    """A report stage failed; stage is "transcription" or "summarization"."""
+
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+
+class PartSummaries:
+    """Map step of map-reduce summarization, fed with transcript segments as they arrive.
+
+    Summarizing parts starts as soon as the segments received so far are long
+    enough that the report will be map-reduced, so early parts are summarized
+    while later ones are still being transcribed. Each part summary is
+    journaled under the hash of its text, so a resumed job only summarizes
+    parts it has not done before.
+    """
+
+    def __init__(self, job_id=None, done=None):
+        self.received = {}  # segment index -> transcript
+        self.tasks = {}  # (segment index, chunk index) -> summarize_part task
+        self.started = False
+        self.job_id = job_id
+        self.done = done or {}  # part key -> summary journaled before a restart
+
+    def add(self, index, text):
+        self.received[index] = text
+        if not self.started:
+            received_chars = sum(len(part) for part in self.received.values())
+            if SUMMARY_MODE != "map_reduce" and received_chars < MAP_REDUCE_MIN_CHARS:
+                return
+            self.started = True
+        self.start_pending()
+
+    def start_pending(self):
+        for segment in sorted(self.received):
+            if (segment, 0) not in self.tasks:
+                self.start(segment, self.received[segment])
+
+    def start(self, index, text):
+        for chunk_index, chunk in enumerate(split_transcript(text, SUMMARY_CHUNK_CHARS)):
+            self.tasks[(index, chunk_index)] = asyncio.create_task(
+                self.summarize(chunk, f"{index}.{chunk_index}")
+            )
+
+    async def summarize(self, chunk, label):
+        key = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        if key in self.done:
+            logger.info(f"Reusing journaled summary of part {label}")
+            return self.done[key]
+        summary = await summarize_part(chunk, label)
+        if "error" not in summary.lower():
+            await journal(self.job_id, save_part, key, summary)
+        return summary
+
+    async def collect(self, transcript):
+        """Wait for every part; parts never reported (e.g. a cached transcript) are split from transcript."""
+        if not self.received:
+            self.received[0] = transcript
+        self.started = True
+        self.start_pending()
+        return await asyncio.gather(*(self.tasks[key] for key in sorted(self.tasks)))
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+def use_map_reduce(transcript):
+    return SUMMARY_MODE == "map_reduce" or (SUMMARY_MODE == "auto" and len(transcript) >= MAP_REDUCE_MIN_CHARS)
+
+def summary_cache_key(transcript):
+    # Map-reduced summaries depend on the part prompt as well
+    prompt = SUMMARY_PROMPT + PART_PROMPT if use_map_reduce(transcript) else SUMMARY_PROMPT
+    return summary_key(SUMMARY_MODEL, prompt, transcript)
+
+async def process_report(user_id, file_path=None, chunks=None, source_id=None, progress=None, job_id=None, store=True):
+    """Transcribe, summarize and store one voice report.
+
+    The audio is either a file on disk or, in streaming mode, an async iterable
+    of byte chunks that is never written to disk. source_id is the Telegram
+    file_unique_id when known; together with the audio hash it lets forwarded
+    copies of a report reuse the cached transcript and summary. progress, when
+    given, is told about each stage and receives the summary as it streams in
+    (see ReportMessage in app/bot.py).
+
+    Long transcripts are summarized map-reduce style (SUMMARY_MODE): parts are
+    summarized concurrently while transcription continues, then combined into
+    the final three-section summary. Blocking stages run in worker threads so
+    the event loop keeps serving Telegram updates and API requests.
+
+    With job_id, progress is recorded in the job journal (app/journal.py):
+    segment transcripts, part summaries, the transcript, the summary and the
+    report ID. Rerunning a journaled job after a restart skips whatever it
+    already finished. With store=False the report is left in the journal as
+    "summarized" for a bulk insert, and no report_id is returned.
+
+    A source file in a scratch directory (app/storage.py) is transcribed only
+    once the disk quota has room for its intermediate files, and is kept,
+    compressed or dropped per VOICE_RETENTION once summarized; the caller
+    still removes the scratch directory.
+    """
+    job = await asyncio.to_thread(load_job, job_id) if job_id else None
+    if job and job["report_id"] is not None:
+        logger.info(f"Job {job_id} was already stored as report {job['report_id']}")
+        return {"report_id": job["report_id"], "transcript": job["transcript"], "summary": job["summary"]}
+
+    cache_keys = []
+    if source_id:
+        cache_keys.append(f"telegram:{source_id}")
+    if file_path:
+        cache_keys.append(f"sha256:{await asyncio.to_thread(audio_hash, file_path)}")
+
+    done_segments = job["segments"] if job else {}
+    parts = PartSummaries(job_id, job["parts"] if job else None)
+    try:
+        transcript = job["transcript"] if job else None
+        if transcript is None:
+            transcript = await lookup_transcript(cache_keys)
+        if transcript is None:
+            await notify(progress, "stage", "transcription")
+            await journal(job_id, set_stage, "transcription")
+            logger.info("Starting transcription")
+            if done_segments:
+                logger.info(f"Resuming with {len(done_segments)} segments already transcribed")
+            if chunks is not None:
+                segments = iter_stream_segments(chunks, skip=set(done_segments))
+            else:
+                segments = iter_transcript_segments(file_path, skip=set(done_segments))
+            transcripts = dict(done_segments)
+            if SUMMARY_MODE != "single":
+                for index in sorted(done_segments):
+                    parts.add(index, done_segments[index])
+            scratch_size = os.path.getsize(file_path) * SCRATCH_EXPANSION if chunks is None else 0
+            with timed("transcription"):
+                async with disk.admit(scratch_size), aclosing(segments):
+                    # Each segment is handed to the later stages as soon as it is transcribed
+                    async for index, segment_transcript in segments:
+                        if "error" in segment_transcript.lower():
+                            logger.error(f"Transcription failed: {segment_transcript}")
+                            raise PipelineError("transcription", segment_transcript)
+                        transcripts[index] = segment_transcript
+                        await journal(job_id, save_segment, index, segment_transcript)
+                        if SUMMARY_MODE != "single":
+                            parts.add(index, segment_transcript)
+                        await notify(progress, "segment_done", len(transcripts))
+            transcript = " ".join(transcripts[index] for index in sorted(transcripts))
+            logger.info(f"Transcription successful: {transcript}")
+            for key in cache_keys:
+                await asyncio.to_thread(put_cached, "transcript", key, transcript)
+        elif done_segments and use_map_reduce(transcript):
+            # Resumed past transcription: part summaries were journaled per segment, so split the same way
+            for index in sorted(done_segments):
+                parts.add(index, done_segments[index])
+
+        key = summary_cache_key(transcript)
+        summary = job["summary"] if job else None
+        if summary is None:
+            summary = await asyncio.to_thread(get_cached, "summary", key)
+        if summary is None:
+            await notify(progress, "stage", "summarization")
+            await journal(job_id, set_stage, "summarization", transcript=transcript)
+            logger.info("Starting summarization")
+            with timed("summarization"):
+                summary_input = transcript
+                if use_map_reduce(transcript):
+                    with timed("summarization_map"):
+                        notes = await parts.collect(transcript)
+                    for part in notes:
+                        if "error" in part.lower():
+                            logger.error(f"Part summarization failed: {part}")
+                            raise PipelineError("summarization", part)
+                    summary_input = join_part_summaries(notes)
+                    logger.info(f"Reducing {len(notes)} part summaries")
+                if progress is not None and STREAM_SUMMARY:
+                    summary = await summarize_text_streaming(
+                        summary_input, lambda partial: notify(progress, "partial_summary", partial)
+                    )
+                else:
+                    summary = await summarize_text(summary_input)
+            if "error" in summary.lower():
+                logger.error(f"Summarization failed: {summary}")
+                raise PipelineError("summarization", summary)
+            logger.info(f"Summarization successful: {summary}")
+            await asyncio.to_thread(put_cached, "summary", key, summary)
+    finally:
+        parts.cancel()  # Only unfinished parts, e.g. after a failure or a cached summary
+
+    file_path = await retain_original(file_path)
+    if not store:
+        await journal(job_id, set_stage, "summarized", transcript=transcript, summary=summary, file_path=file_path)
+        return {"transcript": transcript, "summary": summary}
+
+    await journal(job_id, set_stage, "storing", transcript=transcript, summary=summary, file_path=file_path)
+    result = await store_report(user_id, file_path, transcript, summary)
+    await journal(job_id, set_stage, "stored", report_id=result["report_id"])
+    return result
+
+async def journal(job_id, func, *args, **kwargs):
+    """Call a journal function for job_id in a worker thread; jobs without an ID are not journaled."""
+    if job_id:
+        await asyncio.to_thread(func, job_id, *args, **kwargs)
+
+async def notify(progress, event, value):
+    """Forward a progress event; a failed status update must not fail the report."""
+    if progress is None:
+        return
+    try:
+        await getattr(progress, event)(value)
+    except Exception as e:
+        logger.warning(f"Progress update {event} failed: {str(e)}")
+
+async def cached_report(user_id, source_id):
+    """Return and store the report for an already processed Telegram file, or None.
+
+    Used before the file is downloaded, so a hit costs no download, ffmpeg or API call.
+    """
+    transcript = await lookup_transcript([f"telegram:{source_id}"])
+    if transcript is None:
+        return None
+    summary = await asyncio.to_thread(get_cached, "summary", summary_cache_key(transcript))
+    if summary is None:
+        return None
+    return await store_report(user_id, None, transcript, summary)
+
+async def lookup_transcript(cache_keys):
+    for key in cache_keys:
+        transcript = await asyncio.to_thread(get_cached, "transcript", key)
+        if transcript is not None:
+            # Record it under the other keys too, e.g. the hash of a re-uploaded file
+            for other in cache_keys:
+                if other != key:
+                    await asyncio.to_thread(put_cached, "transcript", other, transcript)
+            return transcript
+    return None
+
+async def store_report(user_id, file_path, transcript, summary):
+    logger.info("Saving to database")
+    with timed("db_write"):
+        report_id = await asyncio.to_thread(save_report, user_id, file_path, transcript, summary)
+    logger.info(f"Saved report with ID {report_id}")
+
+    return {
+        "report_id": report_id,
+        "transcript": transcript,
+        "summary": summary
+    }
@@ -0,0 +1,254 @@
+import logging
+import asyncio
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from app.executor import run_process, MB
+from app.journal import unfinished_files
+from app.metrics import timed, DISK_USED, DISK_RESERVED
+from config.settings import (
+    SCRATCH_DIR, VOICES_DIR, VOICE_RETENTION, VOICE_RETENTION_DAYS, VOICE_ARCHIVE_BITRATE,
+    DISK_QUOTA_MB, DISK_MIN_FREE_MB, DISK_WAIT_TIMEOUT, STORAGE_SWEEP_INTERVAL
+)
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Files on disk:
+#   SCRATCH_DIR/<id>/  one directory per job: the downloaded or uploaded source and
+#                      everything the pipeline derives from it. Removed when the job
+#                      ends; left in place while the job can still be resumed.
+#   VOICES_DIR/        originals kept after their report is stored (VOICE_RETENTION),
+#                      deleted after VOICE_RETENTION_DAYS or when space runs short.
+RETENTION_POLICIES = ("keep", "compress", "delete")
+SCRATCH_EXPANSION = 12  # Peak scratch bytes per source byte: 16kHz PCM, its trimmed copy and the upload encoding
+DISK_POLL_INTERVAL = 1  # Seconds between checks while waiting for disk space
+
+if VOICE_RETENTION not in RETENTION_POLICIES:
+    raise ValueError(f"Unknown VOICE_RETENTION: {VOICE_RETENTION}")
+
+class StorageFullError(Exception):
+    """Raised when there is no disk space for a file or job within the quota."""
+
+active = set()  # Scratch directories in use by this process
+active_lock = threading.Lock()  # Archives are extracted in worker threads
+
+def scratch_file(extension):
+    """Path for a job's source file, in a new scratch directory of its own."""
+    name = uuid.uuid4().hex
+    directory = os.path.abspath(os.path.join(SCRATCH_DIR, name))
+    os.makedirs(directory)
+    with active_lock:
+        active.add(directory)
+    return os.path.join(directory, f"{name}{extension}")
+
+def in_scratch(file_path):
+    if not file_path:
+        return False
+    return os.path.dirname(os.path.dirname(os.path.abspath(file_path))) == os.path.abspath(SCRATCH_DIR)
+
+def remove_scratch(file_path):
+    """Delete the scratch directory of file_path, with whatever the pipeline left in it.
+
+    Called when a job ends, successfully or not; files outside SCRATCH_DIR are left alone.
+    """
+    if not in_scratch(file_path):
+        return
+    directory = os.path.dirname(os.path.abspath(file_path))
+    shutil.rmtree(directory, ignore_errors=True)
+    with active_lock:
+        active.discard(directory)
+    disk.changed.set()
+
+async def retain_original(file_path):
+    """Apply VOICE_RETENTION to a finished job's source file; returns where it is kept, or None.
+
+    Files already outside the scratch directory (e.g. for a resumed job) are returned unchanged.
+    """
+    if not in_scratch(file_path):
+        return file_path
+    if VOICE_RETENTION == "delete":
+        return None  # Goes with the scratch directory
+    os.makedirs(VOICES_DIR, exist_ok=True)
+    if VOICE_RETENTION == "compress":
+        kept_path = os.path.join(VOICES_DIR, os.path.splitext(os.path.basename(file_path))[0] + ".ogg")
+        try:
+            with timed("archive"):
+                await run_process([
+                    "ffmpeg", "-y", "-loglevel", "error", "-i", file_path, "-ac", "1", "-ar", "16000",
+                    "-c:a", "libopus", "-b:a", VOICE_ARCHIVE_BITRATE, "-application", "voip", kept_path
+                ])
+            return kept_path
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"Could not compress {file_path}, keeping it as is: {e.stderr}")
+            if os.path.exists(kept_path):
+                os.remove(kept_path)
+    kept_path = os.path.join(VOICES_DIR, os.path.basename(file_path))
+    await asyncio.to_thread(shutil.move, file_path, kept_path)
+    return kept_path
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while we were counting
+    return total
+
+def used_bytes():
+    """Bytes in scratch directories and kept originals, the total held to DISK_QUOTA_MB."""
+    used = directory_size(SCRATCH_DIR) + directory_size(VOICES_DIR)
+    DISK_USED.set(used)
+    return used
+
+def kept_originals():
+    """(modified time, size, path) of each kept original that no unfinished job needs, oldest first."""
+    pending = unfinished_files()
+    if pending is None or not os.path.isdir(VOICES_DIR):
+        return []
+    pending = {os.path.abspath(path) for path in pending}
+    originals = []
+    for entry in os.scandir(VOICES_DIR):
+        if entry.is_file() and os.path.abspath(entry.path) not in pending:
+            stat = entry.stat()
+            originals.append((stat.st_mtime, stat.st_size, entry.path))
+    return sorted(originals)
+
+def evict_originals(needed):
+    """Delete the oldest kept originals until needed bytes are freed; returns the bytes freed."""
+    freed = 0
+    for modified, size, path in kept_originals():
+        if freed >= needed:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        freed += size
+        logger.info(f"Evicted kept original {path} to free disk space")
+    return freed
+
+def prune_originals():
+    """Delete kept originals older than VOICE_RETENTION_DAYS."""
+    if not VOICE_RETENTION_DAYS:
+        return
+    cutoff = time.time() - VOICE_RETENTION_DAYS * 86400
+    for modified, size, path in kept_originals():
+        if modified > cutoff:
+            break
+        try:
+            os.remove(path)
+            logger.info(f"Deleted kept original {path} after {VOICE_RETENTION_DAYS} days")
+        except OSError:
+            pass
+
+def sweep_scratch():
+    """Remove scratch directories that neither a running job nor a resumable one refers to, e.g. after a crash."""
+    started = time.time()
+    with active_lock:
+        keep = set(active)
+    pending = unfinished_files()
+    if pending is None or not os.path.isdir(SCRATCH_DIR):
+        return  # Without the journal there is no telling which directories are still needed
+    keep.update(os.path.dirname(os.path.abspath(path)) for path in pending)
+    for entry in os.scandir(SCRATCH_DIR):
+        path = os.path.abspath(entry.path)
+        # Directories newer than the snapshot above may belong to a job being created right now
+        if path in keep or entry.stat().st_mtime >= started:
+            continue
+        if entry.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        logger.info(f"Removed orphaned scratch directory {entry.path}")
+
+class DiskQuota:
+    """Holds back disk-hungry work while scratch files and kept originals would exceed the quota.
+
+    Space counts against both DISK_QUOTA_MB and the filesystem's free space
+    less DISK_MIN_FREE_MB. Kept originals are evicted, oldest first, before
+    anything waits or is refused.
+    """
+
+    def __init__(self, quota, min_free):
+        self.quota = quota
+        self.min_free = min_free
+        self.reserved = 0
+        self.changed = asyncio.Event()
+
+    def room(self):
+        """(bytes the quota still allows, bytes free on the filesystem), ignoring reservations."""
+        os.makedirs(SCRATCH_DIR, exist_ok=True)
+        free = shutil.disk_usage(SCRATCH_DIR).free
+        return min(self.quota - used_bytes(), free - self.min_free), free
+
+    async def make_room(self, size):
+        """Evict kept originals as needed for size more bytes; returns (room after reservations, free bytes)."""
+        room, free = await asyncio.to_thread(self.room)
+        room -= self.reserved
+        if room < size:
+            freed = await asyncio.to_thread(evict_originals, size - room)
+            room += freed
+            free += freed
+        return room, free
+
+    async def check(self, size):
+        """Raise StorageFullError unless size more bytes fit now; for files arriving from users."""
+        room, free = await self.make_room(size)
+        if room < size:
+            raise StorageFullError(f"Not enough disk space for {size // MB}MB ({max(room, 0) // MB}MB available)")
+
+    @asynccontextmanager
+    async def admit(self, size):
+        """Reserve size bytes for the enclosed block, waiting up to DISK_WAIT_TIMEOUT for room.
+
+        A job is always admitted when no other holds a reservation and the
+        filesystem has room, so files waiting in the queue cannot keep out the
+        jobs that would clear them. Raises StorageFullError on timeout.
+        """
+        deadline = time.monotonic() + DISK_WAIT_TIMEOUT
+        logged = False
+        while size:
+            room, free = await self.make_room(size)
+            if room >= size or (self.reserved == 0 and free >= size):
+                break
+            if time.monotonic() >= deadline:
+                raise StorageFullError(f"Not enough disk space for {size // MB}MB ({max(room, 0) // MB}MB available)")
+            if not logged:
+                logger.info(f"Waiting for {size // MB}MB of disk space ({self.reserved // MB}MB reserved)")
+                logged = True
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), DISK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        self.reserved += size
+        DISK_RESERVED.set(self.reserved)
+        try:
+            yield
+        finally:
+            self.reserved -= size
+            DISK_RESERVED.set(self.reserved)
+            self.changed.set()
+
+disk = DiskQuota(DISK_QUOTA_MB * MB, DISK_MIN_FREE_MB * MB)
+
+async def run_janitor():
+    """Every STORAGE_SWEEP_INTERVAL, remove orphaned scratch directories and expired originals."""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_scratch)
+            await asyncio.to_thread(prune_originals)
+            await asyncio.to_thread(used_bytes)
+        except Exception as e:
+            logger.error(f"Storage cleanup error: {str(e)}", exc_info=True)
+        await asyncio.sleep(STORAGE_SWEEP_INTERVAL)
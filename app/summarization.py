@@ -1,6 +1,7 @@
 import logging
-import requests
-from config.settings import OPENROUTER_API_KEY
+import json
+from app.http_client import request_with_retry, stream_with_retry
+from config.settings import OPENROUTER_API_KEY, OPENROUTER_BASE_URL
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -8,14 +9,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def summarize_text(text):
-    try:
-        logger.info("Starting summarization")
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        prompt = f"""
+SUMMARY_MODEL = "openai/gpt-4.1-mini"
+SUMMARY_PROMPT = """
         گزارش مالی زیر را به صورت نکات کلیدی و دقیق به زبان فارسی خلاصه کنید. فقط اطلاعات موجود در متن را خلاصه کنید و از افزودن اطلاعات خارجی یا حدس و گمان خودداری کنید. خلاصه باید حدود ۳۰۰ کلمه (۲۵۰–۳۵۰ کلمه) باشد و در سه بخش **اطلاعات کلی**، **رویدادها و تحلیل**، و **توصیه‌ها و سهام** سازماندهی شود. نکات زیر را رعایت کنید:
         - تاریخ ذکرشده در ابتدای گزارش را در بخش **اطلاعات کلی** با ایموجی 🗓️ بیاورید.
         - برای هر ادعا یا وضعیت (مانند افزایش ارزش معاملات)، دلیل ذکرشده در متن را با عبارت **به دلیل** بیاورید.
@@ -26,16 +21,44 @@ def summarize_text(text):
 
         گزارش: {text}
         """
-        payload = {
-            "model": "openai/gpt-4.1-mini",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 1500,  # For ~300 words
-            "temperature": 0.0  # For fidelity
-        }
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
+# Map step of map-reduce summarization: notes for one part of a long report,
+# later combined into the final summary by SUMMARY_PROMPT
+PART_PROMPT = """
+        متن زیر بخشی از یک گزارش صوتی مالی به زبان فارسی است. نکات کلیدی همین بخش را به صورت فهرست کوتاه استخراج کنید تا بعداً با بخش‌های دیگر در یک خلاصه نهایی ترکیب شود. فقط اطلاعات موجود در متن را بیاورید و از افزودن اطلاعات خارجی خودداری کنید. نکات زیر را رعایت کنید:
+        - تاریخ‌ها، اعداد (درصد، قیمت، حجم) و اسامی سهام یا نهادها را دقیقاً همان‌طور که در متن آمده بیاورید.
+        - برای هر ادعا یا وضعیت، دلیل ذکرشده در متن را با عبارت **به دلیل** بیاورید.
+        - نکاتی که در متن **مهم** خوانده شده‌اند را با برچسب **مهم** مشخص کنید.
+        - توصیه‌ها و پیشنهادهای مربوط به سهام را جداگانه ذکر کنید.
+
+        بخش گزارش: {text}
+        """
+PART_MAX_TOKENS = 600
+
+def summary_request(text, stream=False, prompt_template=SUMMARY_PROMPT, max_tokens=1500):
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    prompt = prompt_template.format(text=text)
+    payload = {
+        "model": SUMMARY_MODEL,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": max_tokens,  # 1500 for ~300 words
+        "temperature": 0.0  # For fidelity
+    }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+async def summarize_text(text):
+    try:
+        logger.info("Starting summarization")
+        headers, payload = summary_request(text)
+        response = await request_with_retry(
+            "openrouter", "POST",
+            f"{OPENROUTER_BASE_URL}/chat/completions",
             headers=headers,
             json=payload
         )
@@ -51,3 +74,88 @@ def summarize_text(text):
     except Exception as e:
         logger.error(f"Summarization error: {str(e)}", exc_info=True)
         return f"Summarization error: {str(e)}"
+
+async def summarize_text_streaming(text, on_partial):
+    """Summarize with OpenRouter's SSE stream, awaiting on_partial(summary_so_far) after each token.
+
+    Returns the full summary, or an error string like summarize_text.
+    """
+    try:
+        logger.info("Starting streaming summarization")
+        headers, payload = summary_request(text, stream=True)
+        parts = []
+        async with stream_with_retry(
+            "openrouter", "POST",
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            headers=headers,
+            json=payload
+        ) as response:
+            if response.status_code != 200:
+                error = (await response.aread()).decode(errors="replace")
+                logger.error(f"Summarization error: {error}")
+                return f"Summarization error: {error}"
+            async for line in response.aiter_lines():
+                # Skip blank lines and ": OPENROUTER PROCESSING" keep-alive comments
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"].get("message", str(chunk["error"])))
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    await on_partial("".join(parts))
+
+        summary = "".join(parts).strip()
+        logger.info(f"Summarization successful: {summary}")
+        return summary
+    except Exception as e:
+        logger.error(f"Summarization error: {str(e)}", exc_info=True)
+        return f"Summarization error: {str(e)}"
+
+async def summarize_part(text, index):
+    """Map step: extract the key points of one part of a long transcript."""
+    try:
+        logger.info(f"Summarizing part {index} ({len(text)} characters)")
+        headers, payload = summary_request(text, prompt_template=PART_PROMPT, max_tokens=PART_MAX_TOKENS)
+        response = await request_with_retry(
+            "openrouter", "POST",
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            headers=headers,
+            json=payload
+        )
+
+        if response.status_code == 200:
+            notes = response.json()["choices"][0]["message"]["content"].strip()
+            logger.info(f"Part {index} summary: {notes}")
+            return notes
+        else:
+            error = response.text
+            logger.error(f"Summarization error: {error}")
+            return f"Summarization error: {error}"
+    except Exception as e:
+        logger.error(f"Summarization error: {str(e)}", exc_info=True)
+        return f"Summarization error: {str(e)}"
+
+def join_part_summaries(notes):
+    """Reduce step input: the part notes in transcript order, labelled by part."""
+    return "\n\n".join(f"نکات بخش {index + 1}:\n{part}" for index, part in enumerate(notes))
+
+def split_transcript(text, max_chars):
+    """Split text into chunks of at most max_chars, breaking after a sentence where possible."""
+    chunks = []
+    while len(text) > max_chars:
+        window = text[:max_chars]
+        cut = max(window.rfind(mark) for mark in (". ", "؟ ", "! ", "\n"))
+        if cut < max_chars // 2:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = max_chars - 1
+        chunks.append(text[:cut + 1].strip())
+        text = text[cut + 1:]
+    if text.strip():
+        chunks.append(text.strip())
+    return chunks
@@ -1,9 +1,20 @@
 import logging
 import os
 import subprocess
-import requests
+import asyncio
 import json
-from config.settings import OPENAI_API_KEY
+import wave
+from contextlib import aclosing
+from app.audio import (
+    split_wav, find_quiet_cut, pcm_to_wav, trim_silence, trim_silence_pcm, speech_ratio, timestamp_map
+)
+from app.backends import backend
+from app.executor import memory, limited, run_cpu, run_process, MB
+from app.metrics import timed, AUDIO_BYTES, SPEECH_RATIO
+from config.settings import (
+    TRANSCRIBE_FANOUT, WHISPER_MAX_CONCURRENCY, TASK_MEMORY_MB, UPLOAD_FORMAT, UPLOAD_BITRATE, STREAM_SEGMENT_SECONDS,
+    VAD_ENABLED, FFMPEG_TIMEOUT
+)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -11,128 +22,368 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB safety margin
 TARGET_SAMPLE_RATE = 16000  # 16kHz
-INITIAL_SEGMENT_MS = 120000  # 2 minutes initial guess
+STREAM_READ_SIZE = 64 * 1024  # Bytes read from ffmpeg's stdout at a time
+SEGMENT_SIZE_MARGIN = 0.9  # Aim compressed segments below the limit, bitrate is not exact
+WHISPER_FORMATS = {".flac", ".m4a", ".mp3", ".mp4", ".mpeg", ".mpga", ".oga", ".ogg", ".wav", ".webm"}
+
+# ffmpeg output settings and file extension for each UPLOAD_FORMAT
+UPLOAD_ENCODINGS = {
+    "wav": (["-c:a", "pcm_s16le"], ".wav"),
+    "opus": (["-c:a", "libopus", "-b:a", UPLOAD_BITRATE, "-application", "voip"], ".ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-b:a", UPLOAD_BITRATE], ".mp3"),
+}
+
+# Shared by all reports so concurrent jobs together stay under the Whisper rate limit
+whisper_slots = asyncio.Semaphore(WHISPER_MAX_CONCURRENCY)
+
+async def transcribe_audio(file_path):
+    """Transcribe an audio file and return the full transcript (or an error string)."""
+    return await join_segments(iter_transcript_segments(file_path))
+
+async def transcribe_stream(chunks):
+    """Transcribe an async iterable of audio byte chunks and return the full transcript."""
+    logger.info("Transcribing audio stream")
+    return await join_segments(iter_stream_segments(chunks))
 
-def transcribe_audio(file_path):
+async def join_segments(segments):
+    """Collect (index, transcript) pairs from a segment generator into the ordered transcript."""
+    transcripts = {}
+    async with aclosing(segments):
+        async for index, transcript in segments:
+            if "error" in transcript.lower():
+                logger.error(f"Segment transcription failed: {transcript}")
+                return transcript
+            transcripts[index] = transcript
+    transcript = " ".join(transcripts[index] for index in sorted(transcripts))
+    logger.info(f"Final transcription result: {transcript}")
+    return transcript
+
+async def iter_transcript_segments(file_path, skip=()):
+    """Yield (index, transcript) for each segment of an audio file as soon as it is transcribed.
+
+    Segments are yielded in completion order, not playback order. A failure is
+    yielded as an error string, after which the generator stops; closing the
+    generator early cancels the remaining uploads and removes temporary files.
+    Segment indices in skip (already transcribed by a resumed job) are not sent.
+    """
     try:
         logger.info(f"Transcribing audio file: {file_path}")
         file_size = os.path.getsize(file_path)
         logger.info(f"File size: {file_size} bytes")
 
-        # Convert to WAV with ffmpeg
-        logger.info(f"Converting audio to WAV (16kHz, mono, PCM)")
-        wav_path = file_path.rsplit(".", 1)[0] + ".wav"
+        fanout = asyncio.Semaphore(TRANSCRIBE_FANOUT)
+        max_size = backend.max_file_size  # None when the backend takes any size
+        extension = os.path.splitext(file_path)[1].lower()
+        upload_format = UPLOAD_FORMAT
+        if upload_format == "passthrough":
+            if extension in WHISPER_FORMATS and (max_size is None or file_size <= max_size):
+                logger.info("Uploading source file as-is")
+                if 0 not in skip:
+                    yield 0, await transcribe_limited(file_path, 0, fanout)
+                return
+            upload_format = "opus"  # Source unusable as-is, fall back to compact re-encoding
+
+        # Convert to the upload format with ffmpeg (16kHz, mono)
+        upload_extension = UPLOAD_ENCODINGS[upload_format][1]
+        logger.info(f"Converting audio to {upload_format} (16kHz, mono)")
+        converted_path = file_path.rsplit(".", 1)[0] + "_upload" + upload_extension
         try:
-            subprocess.run([
-                "ffmpeg", "-i", file_path, "-ar", str(TARGET_SAMPLE_RATE),
-                "-ac", "1", "-c:a", "pcm_s16le", wav_path, "-y"
-            ], check=True, capture_output=True, text=True)
-            logger.info(f"Converted to {wav_path}, size: {os.path.getsize(wav_path)} bytes")
-        except subprocess.CalledProcessError as e:
+            joins = await convert_audio(file_path, converted_path, upload_format)
+            logger.info(f"Converted to {converted_path}, size: {os.path.getsize(converted_path)} bytes")
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             logger.error(f"FFmpeg conversion error: {e.stderr}")
-            return f"Transcription error: Failed to convert audio format - {e.stderr}"
-        file_path = wav_path
+            yield 0, f"Transcription error: Failed to convert audio format - {e.stderr}"
+            return
+        file_path = converted_path
         file_size = os.path.getsize(file_path)
 
-        # Split if file exceeds 20MB
-        transcripts = []
-        if file_size > MAX_FILE_SIZE:
-            logger.info("File exceeds 20MB, splitting into segments")
-            audio_duration = get_audio_duration(file_path)
-            segment_ms = INITIAL_SEGMENT_MS
-            total_ms = audio_duration * 1000
-            segments = []
-            start_ms = 0
-
-            # Iteratively adjust segment size
-            while start_ms < total_ms:
-                end_ms = min(start_ms + segment_ms, total_ms)
-                segment_path = f"{file_path[:-4]}_segment_{len(segments)}.wav"
+        segments = [(file_path, file_size)]
+        try:
+            # Split if file exceeds the backend's upload limit (20MB for the API)
+            if max_size is not None and file_size > max_size:
+                logger.info(f"File exceeds {max_size} bytes, splitting into segments")
                 try:
-                    subprocess.run([
-                        "ffmpeg", "-i", file_path, "-ss", str(start_ms / 1000),
-                        "-t", str((end_ms - start_ms) / 1000), segment_path, "-y"
-                    ], check=True, capture_output=True, text=True)
-                    segment_size = os.path.getsize(segment_path)
-                    logger.info(f"Trial segment: {segment_path}, size: {segment_size} bytes")
-                except subprocess.CalledProcessError as e:
+                    with timed("split"):
+                        if upload_format == "wav":
+                            segments = await run_cpu(split_wav, file_path, max_size, joins)
+                        else:
+                            segments = await split_encoded(file_path, max_size)
+                except (wave.Error, EOFError) as e:
+                    logger.error(f"Segment split error: {str(e)}")
+                    yield 0, f"Transcription error: Failed to split audio - {str(e)}"
+                    return
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
                     logger.error(f"FFmpeg segment error: {e.stderr}")
-                    return f"Transcription error: Failed to split audio - {e.stderr}"
+                    yield 0, f"Transcription error: Failed to split audio - {e.stderr}"
+                    return
 
-                if segment_size > MAX_FILE_SIZE:
-                    logger.info("Segment too large, reducing duration")
+            # Transcribe segments concurrently and hand each one on as soon as it is done
+            tasks = [
+                asyncio.create_task(transcribe_indexed(segment_path, index, fanout))
+                for index, (segment_path, segment_size) in enumerate(segments)
+                if index not in skip
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+        finally:
+            # Clean up converted file and segments
+            for segment_path, segment_size in segments + [(file_path, file_size)]:
+                if os.path.exists(segment_path):
+                    logger.info(f"Removing temporary upload file: {segment_path}")
                     os.remove(segment_path)
-                    segment_ms = int(segment_ms * 0.75)  # Reduce by 25%
-                    if segment_ms < 10000:  # Minimum 10 seconds
-                        logger.error("Cannot create small enough segments")
-                        return f"Transcription error: Unable to split audio under 20MB"
-                    continue
-
-                segments.append((segment_path, segment_size))
-                start_ms += segment_ms
-
-            # Transcribe segments
-            for segment_path, segment_size in segments:
-                logger.info(f"Processing segment: {segment_path}, size: {segment_size} bytes")
-                transcript = transcribe_segment(segment_path)
-                if "error" in transcript.lower():
-                    logger.error(f"Segment transcription failed: {transcript}")
-                    return transcript
-                transcripts.append(transcript)
-                os.remove(segment_path)
-
-            transcript = " ".join(transcripts)
-        else:
-            transcript = transcribe_segment(file_path)
-
-        # Clean up WAV file
-        if file_path.endswith(".wav") and os.path.exists(file_path):
-            logger.info(f"Removing temporary WAV file: {file_path}")
-            os.remove(file_path)
-
-        logger.info(f"Final transcription result: {transcript}")
-        return transcript
 
     except Exception as e:
         logger.error(f"Transcription error: {str(e)}", exc_info=True)
-        return f"Transcription error: {str(e)}"
+        yield 0, f"Transcription error: {str(e)}"
+
+async def convert_audio(file_path, converted_path, upload_format):
+    """Convert file_path to 16kHz mono upload_format at converted_path.
+
+    With VAD_ENABLED the audio is decoded to PCM first so pauses can be
+    trimmed, then encoded. Returns the frames of the trimmed audio where
+    pauses were removed, which split_wav prefers as cut points.
+    """
+    codec_args = UPLOAD_ENCODINGS[upload_format][0]
+    if not VAD_ENABLED:
+        with timed("convert"):
+            await run_process([
+                "ffmpeg", "-i", file_path, "-ar", str(TARGET_SAMPLE_RATE),
+                "-ac", "1", *codec_args, converted_path, "-y"
+            ])
+        return []
+
+    base = file_path.rsplit(".", 1)[0]
+    pcm_path = base + "_pcm.wav"
+    speech_path = converted_path if upload_format == "wav" else base + "_speech.wav"
+    try:
+        with timed("convert"):
+            await run_process([
+                "ffmpeg", "-i", file_path, "-ar", str(TARGET_SAMPLE_RATE),
+                "-ac", "1", "-c:a", "pcm_s16le", pcm_path, "-y"
+            ])
+        with timed("vad"):
+            regions, total_frames = await run_cpu(trim_silence, pcm_path, speech_path)
+        log_speech(regions, total_frames)
+        if speech_path != converted_path:
+            with timed("convert"):
+                await run_process(["ffmpeg", "-i", speech_path, *codec_args, converted_path, "-y"])
+        return [trimmed for trimmed, source, frames in timestamp_map(regions)[1:]]
+    finally:
+        for path in (pcm_path, speech_path):
+            if path != converted_path and os.path.exists(path):
+                os.remove(path)
+
+def log_speech(regions, total_frames):
+    """Record how much of the audio was speech, and where the kept regions came from."""
+    ratio = speech_ratio(regions, total_frames)
+    SPEECH_RATIO.observe(ratio)
+    logger.info(f"Speech is {ratio:.0%} of {total_frames / TARGET_SAMPLE_RATE:.1f} seconds")
+    logger.info("Timestamp map (trimmed -> source seconds): " + ", ".join(
+        f"{trimmed / TARGET_SAMPLE_RATE:.1f}->{source / TARGET_SAMPLE_RATE:.1f}"
+        for trimmed, source, frames in timestamp_map(regions)
+    ))
+
+async def transcribe_indexed(file_path, index, fanout, data=None):
+    return index, await transcribe_limited(file_path, index, fanout, data)
 
-def transcribe_segment(file_path):
+async def split_encoded(file_path, max_bytes):
+    """Split a compressed file into segments under max_bytes with one ffmpeg pass.
+
+    The segment length comes from the file's average bitrate; packets are copied,
+    not re-encoded. Returns a list of (segment_path, segment_size) in order.
+    """
+    duration = await get_audio_duration(file_path)
+    bytes_per_second = os.path.getsize(file_path) / duration
+    segment_seconds = int(max_bytes * SEGMENT_SIZE_MARGIN / bytes_per_second)
+    base, extension = os.path.splitext(file_path)
+    pattern = f"{base}_segment_%03d{extension}"
+    logger.info(f"Splitting {file_path} into {segment_seconds} second segments")
+    await run_process([
+        "ffmpeg", "-i", file_path, "-f", "segment", "-segment_time", str(segment_seconds),
+        "-c", "copy", pattern, "-y"
+    ])
+
+    segments = []
+    while os.path.exists(pattern % len(segments)):
+        segment_path = pattern % len(segments)
+        segments.append((segment_path, os.path.getsize(segment_path)))
+        logger.info(f"Created segment: {segment_path}, size: {segments[-1][1]} bytes")
+    return segments
+
+async def iter_stream_segments(chunks, skip=()):
+    """Yield (index, transcript) for audio arriving as an async iterable of byte chunks.
+
+    The chunks are piped into ffmpeg and its PCM output is cut into in-memory
+    WAV segments of STREAM_SEGMENT_SECONDS (snapped to a pause), so nothing is
+    written to disk. Each segment is sent to Whisper as soon as it is complete
+    and yielded as soon as it is transcribed, while the download continues.
+    Ordering and error handling follow iter_transcript_segments.
+    """
+    results = asyncio.Queue()
+    reader = asyncio.create_task(read_stream_segments(chunks, results, skip))
     try:
-        logger.info(f"Sending segment {file_path} to OpenAI Whisper API")
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
-        }
-        with open(file_path, "rb") as audio_file:
-            files = {"file": audio_file}
-            data = {"model": "whisper-1", "language": "fa"}
-            response = requests.post(
-                "https://api.openai.com/v1/audio/transcriptions",
-                headers=headers,
-                files=files,
-                data=data
+        received = 0
+        while True:
+            item = await results.get()
+            if item is None:
+                break
+            received += 1
+            yield item
+        segment_count = await reader
+        if received == 0 and not segment_count:
+            yield 0, "Transcription error: No audio received"
+    finally:
+        reader.cancel()
+
+async def read_stream_segments(chunks, results, skip=()):
+    """Run ffmpeg over chunks and put each segment's (index, transcript) on results, then None.
+
+    At most TRANSCRIBE_FANOUT segments are held in memory; beyond that ffmpeg,
+    and in turn the download, is paused. Segments in skip are cut but not
+    sent. Returns the number of segments cut. ffmpeg is killed once it goes
+    FFMPEG_TIMEOUT seconds without producing output or exiting.
+    """
+    tasks = []
+    index = 0
+    try:
+        async with memory.admit(TASK_MEMORY_MB * MB):  # Held for as long as ffmpeg runs
+            process = await asyncio.create_subprocess_exec(
+                *limited([
+                    "ffmpeg", "-loglevel", "error", "-i", "pipe:0", "-ar", str(TARGET_SAMPLE_RATE),
+                    "-ac", "1", "-f", "s16le", "pipe:1"
+                ]),
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
             )
+            feeder = asyncio.create_task(feed_ffmpeg(process.stdin, chunks))
+            # Read stderr alongside stdout so a chatty ffmpeg cannot block on a full pipe
+            stderr_reader = asyncio.create_task(process.stderr.read())
+            segment_bytes = STREAM_SEGMENT_SECONDS * TARGET_SAMPLE_RATE * 2
+            buffered = asyncio.Semaphore(TRANSCRIBE_FANOUT)
+            fanout = asyncio.Semaphore(TRANSCRIBE_FANOUT)
+            buffer = bytearray()
+            try:
+                while True:
+                    data = await read_with_timeout(process.stdout.read(STREAM_READ_SIZE))
+                    buffer.extend(data)
+                    # Cuts depend only on the audio, never on how the pipe reads fell, so a
+                    # resumed job cuts the same segments and can skip the journaled ones
+                    while len(buffer) >= segment_bytes or (not data and len(buffer) > 1):
+                        if len(buffer) >= segment_bytes:
+                            cut = find_quiet_cut(buffer, TARGET_SAMPLE_RATE, segment_bytes)
+                        else:
+                            cut = len(buffer) & ~1
+                        if index in skip:
+                            logger.info(f"Stream segment {index} was already transcribed")
+                            del buffer[:cut]
+                        else:
+                            await buffered.acquire()
+                            pcm = bytes(buffer[:cut])
+                            del buffer[:cut]
+                            if VAD_ENABLED:
+                                with timed("vad"):
+                                    # Covered by the stream's reservation; admitting it again would wait on ourselves
+                                    pcm, regions = await run_cpu(trim_silence_pcm, pcm, TARGET_SAMPLE_RATE, memory_mb=0)
+                                log_speech(regions, cut // 2)
+                            wav = pcm_to_wav(pcm, TARGET_SAMPLE_RATE)
+                            logger.info(f"Stream segment {index} ready, size: {len(wav)} bytes")
+                            tasks.append(asyncio.create_task(
+                                transcribe_buffered_segment(wav, index, fanout, buffered, results)
+                            ))
+                        index += 1
+                    if not data:
+                        break
+                await feeder  # Surfaces download errors
+                stderr = (await read_with_timeout(stderr_reader)).decode(errors="replace")
+                if await read_with_timeout(process.wait()) != 0:
+                    logger.error(f"FFmpeg conversion error: {stderr}")
+                    await results.put((0, f"Transcription error: Failed to convert audio format - {stderr}"))
+                    return
+                await asyncio.gather(*tasks)
+                return index
+            except BaseException:
+                feeder.cancel()
+                stderr_reader.cancel()
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+    except Exception as e:
+        logger.error(f"Transcription error: {str(e)}", exc_info=True)
+        await results.put((0, f"Transcription error: {str(e)}"))
+    finally:
+        for task in tasks:
+            task.cancel()
+        results.put_nowait(None)
+
+async def read_with_timeout(awaitable):
+    """Await one step of the streaming ffmpeg, giving up after FFMPEG_TIMEOUT seconds without progress."""
+    try:
+        return await asyncio.wait_for(awaitable, FFMPEG_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"Streaming ffmpeg made no progress for {FFMPEG_TIMEOUT} seconds")
+        raise subprocess.TimeoutExpired("ffmpeg", FFMPEG_TIMEOUT, stderr=f"ffmpeg timed out after {FFMPEG_TIMEOUT} seconds")
 
-        if response.status_code == 200:
-            transcript = response.json().get("text", "")
+async def feed_ffmpeg(stdin, chunks):
+    """Write chunks into ffmpeg's stdin, closing it when the source ends or fails."""
+    total = 0
+    try:
+        async for chunk in chunks:
+            stdin.write(chunk)
+            await stdin.drain()
+            total += len(chunk)
+        logger.info(f"Streamed {total} bytes into ffmpeg")
+    finally:
+        stdin.close()
+
+async def transcribe_buffered_segment(wav, index, fanout, buffered, results):
+    try:
+        await results.put(await transcribe_indexed(f"segment_{index}.wav", index, fanout, data=wav))
+    finally:
+        buffered.release()
+
+async def transcribe_limited(file_path, index, fanout, data=None):
+    """Transcribe one segment once a slot is free.
+
+    fanout bounds the segments in flight for one report; whisper_slots bounds
+    the calls in flight across all reports.
+    """
+    async with fanout, whisper_slots:
+        logger.info(f"Segment {index} acquired a Whisper slot")
+        return await transcribe_segment(file_path, data)
+
+async def transcribe_segment(file_path, data=None):
+    """Transcribe one audio file with the configured backend; pass data to use in-memory bytes named file_path.
+
+    With the API backend, throttling, server errors and network failures are
+    retried with backoff by the shared HTTP client, up to SEGMENT_MAX_RETRIES
+    attempts per segment.
+    """
+    try:
+        if data is None:
+            data = await asyncio.to_thread(read_file, file_path)
+        AUDIO_BYTES.labels("uploaded").inc(len(data))
+        transcript = await backend.transcribe(os.path.basename(file_path), data)
+        if "error" not in transcript.lower():
             logger.info(f"Segment transcription result: {transcript}")
-            return transcript
-        else:
-            error = response.text
-            logger.error(f"OpenAI API error: {error}")
-            return f"Transcription error: {error}"
+        return transcript
 
     except Exception as e:
         logger.error(f"Segment transcription error: {str(e)}", exc_info=True)
         return f"Transcription error: {str(e)}"
 
-def get_audio_duration(file_path):
+def read_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+async def get_audio_duration(file_path):
     try:
-        result = subprocess.run(
-            ["ffprobe", "-i", file_path, "-show_entries", "format=duration", "-v", "quiet", "-of", "json"],
-            capture_output=True, text=True, check=True
+        result = await run_process(
+            ["ffprobe", "-i", file_path, "-show_entries", "format=duration", "-v", "quiet", "-of", "json"]
         )
         duration = float(json.loads(result.stdout)["format"]["duration"])
         logger.info(f"Audio duration: {duration} seconds")
@@ -0,0 +1,67 @@
+import os
+import subprocess
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Report lengths covered by the benchmarks, in seconds: the 30-second to 12-minute range the bot is used for
+DURATIONS = (30, 120, 360, 720)
+SAMPLE_RATE = 16000
+WORDS_PER_SECOND = 2.5  # Typical Persian speaking rate, used to size synthetic transcripts
+
+# Speech-like test signal: a voiced tone whose pitch drifts like intonation, shaped
+# into 4 Hz syllables, with a 0.8s pause every 4s, a 3s silence every 30s and a
+# faint noise floor, so silence trimming and split-at-pause have something to find.
+# Deterministic, so every run and every machine gets identical audio.
+SPEECH_EXPR = (
+    "lt(mod(t,4),3.2)*gt(mod(t,30),3)*(0.55+0.45*sin(2*PI*4*t))"
+    "*(0.3*sin(2*PI*(120+30*sin(2*PI*0.5*t))*t)"
+    "+0.15*sin(4*PI*(120+30*sin(2*PI*0.5*t))*t)"
+    "+0.08*sin(6*PI*(120+30*sin(2*PI*0.5*t))*t))"
+    "+0.004*(2*random(0)-1)"
+)
+
+SAMPLE_SENTENCES = (
+    "شاخص کل بورس تهران امروز با رشد ۰٫۷۳ درصدی به کانال دو میلیون و صد هزار واحد رسید",
+    "ارزش معاملات خرد به دلیل ورود نقدینگی حقیقی به بیش از هفت همت افزایش یافت",
+    "نماد فولاد مبارکه با افزایش حجم معاملات در صف خرید قرار گرفت",
+    "بانک اقتصاد نوین به دلیل انتشار گزارش فصلی مثبت مورد توجه سهامداران بود",
+    "این نکته مهم است که ریسک نوسانات نرخ ارز همچنان بر بازار سایه انداخته است",
+    "توصیه می‌شود سرمایه‌گذاران در گروه پتروشیمی با احتیاط بیشتری معامله کنند",
+)
+
+def fixture_path(duration):
+    return os.path.join(FIXTURES_DIR, f"report_{duration}s.ogg")
+
+def generate_fixture(duration, force=False):
+    """Encode a duration-second synthetic report as Telegram-style Ogg/Opus; returns its path.
+
+    Existing fixtures are reused unless force is set.
+    """
+    path = fixture_path(duration)
+    if os.path.exists(path) and not force:
+        return path
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"aevalsrc='{SPEECH_EXPR}':s={SAMPLE_RATE}:d={duration}",
+        "-ac", "1", "-c:a", "libopus", "-b:a", "24k", "-application", "voip",
+        path
+    ], check=True)
+    return path
+
+def generate_fixtures(durations=DURATIONS, force=False):
+    return {duration: generate_fixture(duration, force) for duration in durations}
+
+def transcript_text(words):
+    """A Persian financial transcript of about `words` words."""
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = SAMPLE_SENTENCES[len(sentences) % len(SAMPLE_SENTENCES)]
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return ". ".join(sentences) + "."
+
+if __name__ == "__main__":
+    for duration, path in generate_fixtures(force=True).items():
+        print(f"{duration}s: {path} ({os.path.getsize(path)} bytes)")
@@ -0,0 +1,165 @@
+"""Local stand-ins for the Whisper, OpenRouter and Telegram Bot APIs.
+
+Run with `python -m benchmarks.mock_servers`; benchmarks/run.py starts it for
+you. Point the app at it with OPENAI_BASE_URL=http://HOST:PORT/openai/v1,
+OPENROUTER_BASE_URL=http://HOST:PORT/openrouter/api/v1,
+TELEGRAM_BASE_URL=http://HOST:PORT/telegram/bot and
+TELEGRAM_FILE_BASE_URL=http://HOST:PORT/telegram/file/bot.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import Counter
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import uvicorn
+from benchmarks.fixtures import FIXTURES_DIR, WORDS_PER_SECOND, transcript_text
+
+UPLOAD_BYTES_PER_SECOND = 4000  # 32 kbit/s Opus, the default UPLOAD_BITRATE
+
+app = FastAPI()
+
+# Replaced from the command line, see main()
+config = argparse.Namespace(
+    whisper_latency=0.3,
+    whisper_seconds_per_mb=10.0,
+    openrouter_latency=1.0,
+    token_delay=0.01,
+    telegram_latency=0.05,
+    rate_limit_every=0,
+    retry_after=1.0,
+    fixtures=FIXTURES_DIR,
+)
+
+requests_seen = Counter()  # upstream -> requests received, for 429 injection and /stats
+message_ids = itertools.count(1)
+
+def throttled(upstream):
+    """Count a request and tell whether it should get a 429 (every rate_limit_every-th one)."""
+    requests_seen[upstream] += 1
+    return config.rate_limit_every > 0 and requests_seen[upstream] % config.rate_limit_every == 0
+
+def rate_limited():
+    return JSONResponse(
+        {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+        status_code=429,
+        headers={"Retry-After": str(config.retry_after)}
+    )
+
+SUMMARY = transcript_text(300)
+
+@app.get("/health")
+async def health():
+    return {"ok": True}
+
+@app.get("/stats")
+async def stats():
+    return dict(requests_seen)
+
+@app.post("/openai/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    form = await request.form()
+    if throttled("whisper"):
+        return rate_limited()
+    upload = form.get("file")
+    if upload is None:
+        raise HTTPException(status_code=400, detail="file is required")
+    size = len(await upload.read())
+    await asyncio.sleep(config.whisper_latency + config.whisper_seconds_per_mb * size / (1024 * 1024))
+    # As much text as the upload would hold speech for
+    words = max(1, int(size / UPLOAD_BYTES_PER_SECOND * WORDS_PER_SECOND))
+    return {"text": transcript_text(words)}
+
+@app.post("/openrouter/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    if throttled("openrouter"):
+        return rate_limited()
+    words = SUMMARY.split(" ")[:payload.get("max_tokens", 1500)]
+    if not payload.get("stream"):
+        await asyncio.sleep(config.openrouter_latency + config.token_delay * len(words))
+        return {"choices": [{"message": {"role": "assistant", "content": " ".join(words)}}]}
+
+    async def events():
+        yield ": OPENROUTER PROCESSING\n\n"
+        await asyncio.sleep(config.openrouter_latency)
+        for word in words:
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(config.token_delay)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def telegram_message(chat_id, text, message_id=None):
+    return {
+        "message_id": message_id or next(message_ids),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+        "text": text,
+    }
+
+@app.post("/telegram/bot{token}/{method}")
+async def telegram(token: str, method: str, request: Request):
+    # python-telegram-bot posts parameters as a form, other clients may send JSON
+    if request.headers.get("content-type", "").startswith("application/json"):
+        params = await request.json()
+    else:
+        params = dict(await request.form())
+    requests_seen[f"telegram.{method}"] += 1
+    await asyncio.sleep(config.telegram_latency)
+    if method == "getMe":
+        result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+    elif method == "getFile":
+        file_id = params["file_id"]
+        path = os.path.join(config.fixtures, os.path.basename(file_id))
+        if not os.path.exists(path):
+            return JSONResponse({"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}, status_code=400)
+        result = {
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_size": os.path.getsize(path),
+            "file_path": f"voice/{os.path.basename(file_id)}",
+        }
+    elif method == "sendMessage":
+        result = telegram_message(int(params["chat_id"]), params["text"])
+    elif method == "editMessageText":
+        result = telegram_message(int(params["chat_id"]), params["text"], int(params["message_id"]))
+    else:
+        result = True
+    return {"ok": True, "result": result}
+
+@app.get("/telegram/file/bot{token}/{file_path:path}")
+async def telegram_file(token: str, file_path: str):
+    path = os.path.join(config.fixtures, os.path.basename(file_path))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, media_type="audio/ogg")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--whisper-latency", type=float, default=config.whisper_latency, help="Seconds per transcription request")
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=config.whisper_seconds_per_mb, help="Extra seconds per MB uploaded")
+    parser.add_argument("--openrouter-latency", type=float, default=config.openrouter_latency, help="Seconds to the first summary token")
+    parser.add_argument("--token-delay", type=float, default=config.token_delay, help="Seconds between summary tokens")
+    parser.add_argument("--telegram-latency", type=float, default=config.telegram_latency, help="Seconds per Bot API call")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth Whisper/OpenRouter request with 429 (0 = never)")
+    parser.add_argument("--retry-after", type=float, default=config.retry_after, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory Telegram files are served from")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    for name, value in vars(args).items():
+        if hasattr(config, name):
+            setattr(config, name, value)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""End-to-end benchmarks of the voice report pipeline against local stand-in servers.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenario telegram --durations 120,720 --runs 10 --concurrency 4
+    python -m benchmarks.run --rate-limit-every 5 --json results.json
+
+Synthetic reports (benchmarks/fixtures.py) are pushed through transcribe_audio,
+summarize_text, the Telegram voice handler and POST /transcribe, with Whisper,
+OpenRouter and Telegram served by benchmarks/mock_servers.py. Everything runs
+in a temporary directory with its own cache and journal, and the result cache
+is disabled so every run does the full work. Reports are not written to
+PostgreSQL unless --with-db is given.
+
+Needs ffmpeg and ffprobe, like the app itself.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import httpx
+from benchmarks.fixtures import DURATIONS, WORDS_PER_SECOND, generate_fixtures, transcript_text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("transcribe", "summarize", "summarize_stream", "telegram", "api")
+AUDIO_SCENARIOS = {"transcribe", "telegram", "api"}  # Need ffmpeg-generated fixtures; the others only need a length
+RSS_SAMPLE_INTERVAL = 0.05
+MOCK_STARTUP_TIMEOUT = 15
+# Settings that change what is being measured, recorded with each result
+RECORDED_SETTINGS = (
+    "TRANSCRIBE_BACKEND", "UPLOAD_FORMAT", "UPLOAD_BITRATE", "VAD_ENABLED", "STREAM_AUDIO", "STREAM_SUMMARY",
+    "SUMMARY_MODE", "JOB_CONCURRENCY", "TRANSCRIBE_FANOUT", "WHISPER_MAX_CONCURRENCY", "CPU_WORKERS",
+)
+
+def configure_environment(args, workdir):
+    """Point the app at the mock servers and a scratch directory; must run before app modules are imported."""
+    base = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{base}/openai/v1",
+        "OPENROUTER_BASE_URL": f"{base}/openrouter/api/v1",
+        "TELEGRAM_BASE_URL": f"{base}/telegram/bot",
+        "TELEGRAM_FILE_BASE_URL": f"{base}/telegram/file/bot",
+        "OPENAI_API_KEY": "bench",
+        "OPENROUTER_API_KEY": "bench",
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "CACHE_PATH": os.path.join(workdir, "cache.db"),
+        "CACHE_TTL_DAYS": "0",  # Every lookup misses, so repeated runs are not served from the cache
+        "JOURNAL_PATH": os.path.join(workdir, "jobs.db"),
+    })
+    # The mock servers do not enforce the real quotas; raise them unless set explicitly
+    os.environ.setdefault("WHISPER_REQUESTS_PER_MINUTE", "100000")
+    os.environ.setdefault("OPENROUTER_REQUESTS_PER_MINUTE", "100000")
+
+def start_mock_servers(args):
+    command = [
+        sys.executable, "-m", "benchmarks.mock_servers",
+        "--port", str(args.port),
+        "--whisper-latency", str(args.whisper_latency),
+        "--whisper-seconds-per-mb", str(args.whisper_seconds_per_mb),
+        "--openrouter-latency", str(args.openrouter_latency),
+        "--token-delay", str(args.token_delay),
+        "--telegram-latency", str(args.telegram_latency),
+        "--rate-limit-every", str(args.rate_limit_every),
+        "--retry-after", str(args.retry_after),
+    ]
+    process = subprocess.Popen(command, cwd=ROOT)
+    deadline = time.monotonic() + MOCK_STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Mock servers exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/health").status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Mock servers did not start within {MOCK_STARTUP_TIMEOUT} seconds")
+
+def process_tree(root, exclude=()):
+    """PIDs of root and all its descendants, leaving out the subtrees of exclude."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids = []
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        if pid in exclude:
+            continue
+        pids.append(pid)
+        stack.extend(children.get(pid, ()))
+    return pids
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+class PeakRSS(threading.Thread):
+    """Samples the resident memory of this process plus its ffmpeg runs and pool workers.
+
+    The mock servers are excluded. take() returns the peak since the last call.
+    """
+
+    def __init__(self, exclude=()):
+        super().__init__(daemon=True)
+        self.exclude = set(exclude)
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def run(self):
+        while True:
+            total = sum(rss_bytes(pid) for pid in process_tree(os.getpid(), self.exclude))
+            with self.lock:
+                self.peak = max(self.peak, total)
+            time.sleep(RSS_SAMPLE_INTERVAL)
+
+    def take(self):
+        with self.lock:
+            peak, self.peak = self.peak, 0
+        return peak
+
+def stage_totals():
+    """Total seconds recorded so far for each pipeline stage (see app/metrics.py)."""
+    from app.metrics import STAGE_SECONDS
+
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_sum"):
+                totals[sample.labels["stage"]] = sample.value
+    return totals
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+async def measure(run_one, runs, concurrency):
+    """Await run_one(i) for each run, at most concurrency at once; run_one returns True on success.
+
+    Returns (latencies, errors, wall seconds).
+    """
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def timed_run(i):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                ok = await run_one(i)
+            except Exception as e:
+                print(f"Run {i} failed: {e!r}", file=sys.stderr)
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed_run(i) for i in range(runs)))
+    return latencies, errors, time.perf_counter() - start
+
+def copy_fixture(path):
+    """A private copy under voices/, as the bot would download it; the pipeline writes files next to it."""
+    os.makedirs("voices", exist_ok=True)
+    copy = f"voices/{uuid.uuid4()}{os.path.splitext(path)[1]}"
+    shutil.copyfile(path, copy)
+    return copy
+
+def voice_update(update_id, file_id, duration, file_size):
+    """A Telegram update carrying a voice message, as the Bot API would deliver it."""
+    user = {"id": 100000 + update_id, "is_bot": False, "first_name": "Bench"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "voice": {
+                "file_id": file_id,
+                "file_unique_id": f"{file_id}-{update_id}",
+                "duration": duration,
+                "mime_type": "audio/ogg",
+                "file_size": file_size,
+            },
+        },
+    }
+
+class Scenarios:
+    """Builds a run_one(i) coroutine function per scenario and audio length."""
+
+    def __init__(self, args):
+        self.args = args
+        self.update_ids = itertools.count(1)
+        self.application = None
+        self.client = None
+        self.pending = {}  # Telegram update ID -> future resolved when its job finishes
+
+    async def start(self):
+        from app import bot
+        from app.api import app as fastapi_app
+        from app.journal import load_job
+
+        if "telegram" in self.args.scenario:
+            self.application = bot.setup_bot()
+            await self.application.initialize()
+            original = bot.process_voice_job
+
+            # Jobs run on the scheduler after the handler returns; resolve the run's future when its job ends
+            async def tracked(update, context, audio_obj, queued_at, job_id=None):
+                ok = False
+                try:
+                    await original(update, context, audio_obj, queued_at, job_id)
+                    job = await asyncio.to_thread(load_job, job_id)
+                    ok = job is not None and job["stage"] == "done"
+                finally:
+                    future = self.pending.pop(update.update_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(ok)
+
+            bot.process_voice_job = tracked
+        if "api" in self.args.scenario:
+            self.client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=fastapi_app), base_url="http://bench", timeout=None
+            )
+
+    async def stop(self):
+        if self.application is not None:
+            await self.application.shutdown()
+        if self.client is not None:
+            await self.client.aclose()
+
+    def runner(self, scenario, duration, path):
+        return getattr(self, scenario)(duration, path)
+
+    def transcribe(self, duration, path):
+        from app.transcription import transcribe_audio
+
+        async def run_one(i):
+            copy = copy_fixture(path)
+            try:
+                transcript = await transcribe_audio(copy)
+            finally:
+                os.remove(copy)
+            return "error" not in transcript.lower()
+        return run_one
+
+    def summarize(self, duration, path):
+        from app.summarization import summarize_text
+
+        text = transcript_text(int(duration * WORDS_PER_SECOND))
+
+        async def run_one(i):
+            summary = await summarize_text(text)
+            return "error" not in summary.lower()
+        return run_one
+
+    def summarize_stream(self, duration, path):
+        from app.summarization import summarize_text_streaming
+
+        text = transcript_text(int(duration * WORDS_PER_SECOND))
+
+        async def on_partial(summary):
+            pass
+
+        async def run_one(i):
+            summary = await summarize_text_streaming(text, on_partial)
+            return "error" not in summary.lower()
+        return run_one
+
+    def telegram(self, duration, path):
+        from telegram import Update
+        from telegram.ext import CallbackContext
+        from app.bot import handle_voice_or_audio
+
+        file_size = os.path.getsize(path)
+
+        async def run_one(i):
+            update_id = next(self.update_ids)
+            update = Update.de_json(
+                voice_update(update_id, os.path.basename(path), duration, file_size), self.application.bot
+            )
+            context = CallbackContext.from_update(update, self.application)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[update_id] = future
+            await handle_voice_or_audio(update, context)
+            try:
+                # A refused report never reaches a worker, so give up after the timeout
+                return await asyncio.wait_for(future, self.args.timeout)
+            except asyncio.TimeoutError:
+                self.pending.pop(update_id, None)
+                return False
+        return run_one
+
+    def api(self, duration, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        async def run_one(i):
+            response = await self.client.post(
+                "/transcribe", files={"file": (os.path.basename(path), data, "audio/ogg")}
+            )
+            return response.status_code == 200
+        return run_one
+
+async def run_benchmarks(args, fixtures, sampler):
+    scenarios = Scenarios(args)
+    await scenarios.start()
+    results = []
+    try:
+        for scenario in args.scenario:
+            for duration, path in fixtures.items():
+                run_one = scenarios.runner(scenario, duration, path)
+                if args.warmup:
+                    await measure(run_one, args.warmup, args.concurrency)
+                before = stage_totals()
+                sampler.take()
+                latencies, errors, wall = await measure(run_one, args.runs, args.concurrency)
+                peak = sampler.take()
+                after = stage_totals()
+                result = {
+                    "scenario": scenario,
+                    "audio_seconds": duration,
+                    "runs": args.runs,
+                    "errors": errors,
+                    "wall_seconds": round(wall, 3),
+                    "reports_per_minute": round(args.runs / wall * 60, 2),
+                    "audio_minutes_per_minute": round(args.runs * duration / wall, 2),
+                    "p50_seconds": round(statistics.median(latencies), 3),
+                    "p95_seconds": round(percentile(latencies, 0.95), 3),
+                    "peak_rss_mb": round(peak / (1024 * 1024), 1),
+                    # Stage time summed over concurrent work (segments, workers), per report
+                    "stage_seconds": {
+                        stage: round((after[stage] - before.get(stage, 0)) / args.runs, 3)
+                        for stage in sorted(after)
+                        if after[stage] > before.get(stage, 0)
+                    },
+                }
+                print_result(result)
+                results.append(result)
+    finally:
+        await scenarios.stop()
+    return results
+
+def print_result(result):
+    print(
+        f"{result['scenario']:<17} {result['audio_seconds']:>4}s  runs {result['runs']:>3}  errors {result['errors']:>2}  "
+        f"p50 {result['p50_seconds']:>7.2f}s  p95 {result['p95_seconds']:>7.2f}s  "
+        f"{result['reports_per_minute']:>7.2f} reports/min  {result['audio_minutes_per_minute']:>6.2f} audio min/min  "
+        f"peak RSS {result['peak_rss_mb']:>6.1f}MB",
+        flush=True
+    )
+    if result["stage_seconds"]:
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["stage_seconds"].items())
+        print(f"{'':<17} per report: {stages}", flush=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", default=",".join(SCENARIOS), help=f"Comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--durations", default=",".join(map(str, DURATIONS)), help="Report lengths in seconds")
+    parser.add_argument("--runs", type=int, default=5, help="Measured runs per scenario and length")
+    parser.add_argument("--concurrency", type=int, default=1, help="Runs in flight at once")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs before each measurement")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds to wait for a Telegram report to finish")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the mock servers")
+    parser.add_argument("--whisper-latency", type=float, default=0.3)
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=10.0)
+    parser.add_argument("--openrouter-latency", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth upstream request with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--with-db", action="store_true", help="Store reports in DATABASE_URL instead of discarding them")
+    parser.add_argument("--json", help="Also write the results, settings and options to this file")
+    args = parser.parse_args(argv)
+    args.scenario = [name.strip() for name in args.scenario.split(",") if name.strip()]
+    unknown = set(args.scenario) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    args.durations = [int(value) for value in args.durations.split(",")]
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if AUDIO_SCENARIOS.intersection(args.scenario):
+        fixtures = generate_fixtures(args.durations)
+    else:
+        fixtures = {duration: None for duration in args.durations}
+    workdir = tempfile.mkdtemp(prefix="voice-bench-")
+    configure_environment(args, workdir)
+    mock = start_mock_servers(args)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # voices/ and the pipeline's temporary files
+    try:
+        # Imported only now, so the settings pick up the environment above
+        from config import settings
+        from app import pipeline
+        from app.executor import start_pool, shutdown_pool
+
+        start_pool()
+        if args.with_db:
+            from app.database import init_pool, init_db
+            init_pool()
+            init_db()
+        else:
+            report_ids = itertools.count(1)
+            pipeline.save_report = lambda user_id, voice_file_path, transcript, summary: next(report_ids)
+
+        sampler = PeakRSS(exclude={mock.pid})
+        sampler.start()
+        results = asyncio.run(run_benchmarks(args, fixtures, sampler))
+        shutdown_pool()
+        if args.json:
+            options = {name: value for name, value in vars(args).items() if name != "json"}
+            with open(os.path.join(cwd, args.json), "w") as f:
+                json.dump({
+                    "options": options,
+                    "settings": {name: getattr(settings, name) for name in RECORDED_SETTINGS},
+                    "results": results,
+                }, f, indent=2)
+    finally:
+        mock.terminate()
+        mock.wait()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -7,3 +7,89 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Upstream endpoints; override to point at local stand-ins (see benchmarks/)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")  # e.g. http://127.0.0.1:8765/telegram/bot, default api.telegram.org
+TELEGRAM_FILE_BASE_URL = os.getenv("TELEGRAM_FILE_BASE_URL")  # e.g. http://127.0.0.1:8765/telegram/file/bot
+
+# Job scheduling
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))  # Reports processed at once
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "20"))  # Reports waiting before new ones are refused
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "5"))  # Waiting reports allowed per user
+
+# Transcription
+TRANSCRIBE_FANOUT = int(os.getenv("TRANSCRIBE_FANOUT", "4"))  # Segments of one report sent at once
+WHISPER_MAX_CONCURRENCY = int(os.getenv("WHISPER_MAX_CONCURRENCY", "4"))  # Whisper calls in flight across all reports
+SEGMENT_MAX_RETRIES = int(os.getenv("SEGMENT_MAX_RETRIES", "3"))  # Attempts per segment before the report fails
+UPLOAD_FORMAT = os.getenv("UPLOAD_FORMAT", "opus")  # opus, mp3, wav, or passthrough (send the source file when Whisper accepts it)
+UPLOAD_BITRATE = os.getenv("UPLOAD_BITRATE", "32k")  # Bitrate for opus/mp3 uploads
+STREAM_AUDIO = os.getenv("STREAM_AUDIO", "false").lower() == "true"  # Pipe downloads through ffmpeg without temporary files
+STREAM_SEGMENT_SECONDS = int(os.getenv("STREAM_SEGMENT_SECONDS", "120"))  # Audio per in-memory segment in streaming mode
+VAD_ENABLED = os.getenv("VAD_ENABLED", "true").lower() == "true"  # Trim pauses and dead air before upload (not in passthrough)
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "api")  # api, local, or api_with_local_fallback
+API_FALLBACK_TIMEOUT = float(os.getenv("API_FALLBACK_TIMEOUT", "180"))  # Seconds before a slow API segment is redone locally
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "openai/whisper-base")  # Peaks near 300MB while loading; whisper-small needs about 1GB
+LOCAL_WHISPER_BATCH_SIZE = int(os.getenv("LOCAL_WHISPER_BATCH_SIZE", "4"))  # 30-second chunks decoded together
+LOCAL_WHISPER_THREADS = int(os.getenv("LOCAL_WHISPER_THREADS", str(os.cpu_count() or 1)))
+
+# Audio processing
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))  # Worker processes for CPU-bound audio work
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "300"))  # Seconds before an ffmpeg/ffprobe run is killed
+TASK_MEMORY_MB = int(os.getenv("TASK_MEMORY_MB", "64"))  # Expected peak memory of one ffmpeg run or CPU task
+MEMORY_RESERVE_MB = int(os.getenv("MEMORY_RESERVE_MB", "150"))  # Kept free for the bot, API and database
+JOB_MEMORY_LIMIT_MB = int(os.getenv("JOB_MEMORY_LIMIT_MB", "768"))  # Hard address-space cap per ffmpeg run and CPU worker, 0 for none
+
+# Scratch storage
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "scratch")  # Per-job working directories, removed when the job ends
+VOICES_DIR = os.getenv("VOICES_DIR", "voices")  # Where originals are kept after their report is stored; may be another volume
+VOICE_RETENTION = os.getenv("VOICE_RETENTION", "keep")  # keep, compress (re-encode to low-bitrate Opus), or delete
+VOICE_RETENTION_DAYS = int(os.getenv("VOICE_RETENTION_DAYS", "30"))  # Kept originals are deleted after this, 0 for never
+VOICE_ARCHIVE_BITRATE = os.getenv("VOICE_ARCHIVE_BITRATE", "16k")  # Bitrate of compressed originals
+DISK_QUOTA_MB = int(os.getenv("DISK_QUOTA_MB", "2048"))  # Scratch plus kept originals; the oldest originals are evicted first
+DISK_MIN_FREE_MB = int(os.getenv("DISK_MIN_FREE_MB", "500"))  # Always left free on the filesystem
+DISK_WAIT_TIMEOUT = float(os.getenv("DISK_WAIT_TIMEOUT", "300"))  # Seconds a job waits for disk space before failing
+STORAGE_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))  # Seconds between retention and scratch cleanups
+
+# Result cache
+CACHE_PATH = os.getenv("CACHE_PATH", "cache.db")  # Local SQLite file for cached transcripts and summaries
+CACHE_TTL_DAYS = int(os.getenv("CACHE_TTL_DAYS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+
+# Job journal
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "jobs.db")  # Local SQLite file recording each job's progress for resume after a restart
+JOURNAL_RETENTION_DAYS = int(os.getenv("JOURNAL_RETENTION_DAYS", "7"))  # Finished jobs are kept this long
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"  # Ignore messages sent while the bot was down
+
+# Telegram updates
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling")  # polling, or webhook (served by the API server)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public HTTPS base URL of the API server, e.g. https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Telegram sends it back in X-Telegram-Bot-Api-Secret-Token
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))  # Updates handled at once; one at a time per chat
+
+# Batch ingestion
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "1"))  # Batch reports handed to the job workers at once, at most JOB_MAX_PER_USER
+BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "50"))  # Finished batch reports stored per database insert
+BATCH_FLUSH_INTERVAL = float(os.getenv("BATCH_FLUSH_INTERVAL", "30"))  # Seconds before a partial insert is flushed
+
+# Database
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))  # Keep at least JOB_CONCURRENCY plus a few for the API
+
+# Upstream HTTP
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))  # Seconds per request; Whisper uploads of long segments are slow
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))  # Attempts per request for 429, 5xx and network errors
+WHISPER_REQUESTS_PER_MINUTE = int(os.getenv("WHISPER_REQUESTS_PER_MINUTE", "50"))
+OPENROUTER_REQUESTS_PER_MINUTE = int(os.getenv("OPENROUTER_REQUESTS_PER_MINUTE", "60"))
+
+# Telegram replies
+STREAM_SUMMARY = os.getenv("STREAM_SUMMARY", "true").lower() == "true"  # Edit the reply as summary tokens arrive
+SUMMARY_EDIT_INTERVAL = float(os.getenv("SUMMARY_EDIT_INTERVAL", "2"))  # Minimum seconds between edits of one message
+
+# Summarization
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "auto")  # single, map_reduce, or auto (map-reduce long transcripts)
+MAP_REDUCE_MIN_CHARS = int(os.getenv("MAP_REDUCE_MIN_CHARS", "6000"))  # Roughly six minutes of Persian speech
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "4000"))  # Longest transcript part summarized in one map call
@@ -1,6 +1,15 @@
 import logging
-from app.bot import setup_bot
-from app.api import app as fastapi_app
+from app.bot import setup_bot, resume_voice_jobs
+from app.api import app as fastapi_app, resume_upload_jobs, WEBHOOK_PATH
+from app.database import init_pool, init_db, close_pool
+from app.http_client import close_client
+from app.backends import backend
+from app.executor import start_pool, shutdown_pool
+from app.batch import batch_runner
+from app.jobs import scheduler
+from app.storage import run_janitor
+from config.settings import DROP_PENDING_UPDATES, TELEGRAM_MODE, WEBHOOK_URL, WEBHOOK_SECRET
+from telegram import Update
 import uvicorn
 import asyncio
 
@@ -12,23 +21,75 @@ logger = logging.getLogger(__name__)
 
 async def main():
     logger.info("Starting application")
-    
+    if TELEGRAM_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise RuntimeError("TELEGRAM_MODE=webhook requires WEBHOOK_URL")
+        # Without it anyone who can reach the API could post updates as any user
+        if not WEBHOOK_SECRET:
+            raise RuntimeError("TELEGRAM_MODE=webhook requires WEBHOOK_SECRET")
+    start_pool()
+
+    # Open the shared database pool and make sure the schema exists
+    logger.info("Initializing database")
+    await asyncio.to_thread(init_pool)
+    await asyncio.to_thread(init_db)
+
+    # Load the local Whisper model now rather than on the first report
+    logger.info(f"Preparing {backend.name} transcription backend")
+    await asyncio.to_thread(backend.preload)
+
     # Start Telegram bot
     logger.info("Initializing Telegram bot")
     bot_app = setup_bot()
     await bot_app.initialize()
-    logger.info("Starting bot polling")
     await bot_app.start()
-    bot_task = asyncio.create_task(bot_app.updater.start_polling(drop_pending_updates=True))
+    if TELEGRAM_MODE == "webhook":
+        # Updates arrive on the FastAPI server started below and go straight into the bot's queue
+        logger.info(f"Registering webhook {WEBHOOK_URL}{WEBHOOK_PATH}")
+        fastapi_app.state.telegram = bot_app
+        await bot_app.bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=DROP_PENDING_UPDATES
+        )
+        tasks = []
+    else:
+        logger.info("Starting bot polling")
+        tasks = [asyncio.create_task(bot_app.updater.start_polling(drop_pending_updates=DROP_PENDING_UPDATES))]
+
+    # Pick up reports that were interrupted by the last shutdown or crash
+    await resume_voice_jobs(bot_app)
+    await resume_upload_jobs()
     
     # Start FastAPI
     logger.info("Starting FastAPI server")
     config = uvicorn.Config(fastapi_app, host="0.0.0.0", port=8001)
     server = uvicorn.Server(config)
-    fastapi_task = asyncio.create_task(server.serve())
-    
-    # Wait for both tasks
-    await asyncio.gather(bot_task, fastapi_task)
+    server_task = asyncio.create_task(server.serve())
+
+    # Work through /batch jobs, including ones left over from before a restart
+    tasks.append(asyncio.create_task(batch_runner.run()))
+
+    # Clear scratch directories left by a crash and expire kept originals
+    tasks.append(asyncio.create_task(run_janitor()))
+
+    # Run until uvicorn exits on SIGINT/SIGTERM; the background loops never return on their own
+    try:
+        await server_task
+    finally:
+        logger.info("Stopping background tasks")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await scheduler.stop()
+        if bot_app.updater.running:
+            await bot_app.updater.stop()
+        await bot_app.stop()
+        await bot_app.shutdown()
+        await close_client()
+        await asyncio.to_thread(close_pool)
+        await asyncio.to_thread(shutdown_pool)
     logger.info("Application shutdown")
 
 if __name__ == "__main__":
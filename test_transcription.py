@@ -1,3 +1,4 @@
+import asyncio
 from app.transcription import transcribe_audio
 
-print(transcribe_audio("tests/sample_audio.ogg"))
+print(asyncio.run(transcribe_audio("tests/sample_audio.ogg")))
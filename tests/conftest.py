@@ -0,0 +1,13 @@
+import pytest
+import app.cache
+import app.journal
+import app.storage
+
+@pytest.fixture(autouse=True)
+def local_files(tmp_path, monkeypatch):
+    """Keep the cache, the job journal and scratch files of each test in its own directory."""
+    monkeypatch.setattr(app.cache, "CACHE_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(app.journal, "JOURNAL_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(app.storage, "SCRATCH_DIR", str(tmp_path / "scratch"))
+    monkeypatch.setattr(app.storage, "VOICES_DIR", str(tmp_path / "voices"))
+    monkeypatch.setattr(app.storage, "active", set())
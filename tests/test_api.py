@@ -0,0 +1,16 @@
+from datetime import datetime, timezone, timedelta
+import pytest
+from app.api import encode_cursor, decode_cursor
+
+def test_cursor_round_trip():
+    position = (datetime(2024, 3, 1, 9, 30, 15, 123456, tzinfo=timezone(timedelta(hours=3, minutes=30))), 42)
+    assert decode_cursor(encode_cursor(position)) == position
+
+def test_cursor_without_microseconds():
+    position = (datetime(2024, 3, 1, 9, 30, tzinfo=timezone.utc), 7)
+    assert decode_cursor(encode_cursor(position)) == position
+
+@pytest.mark.parametrize("cursor", ["", "garbage", "2024-03-01T09:30:00_x", "notadate_5"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,69 @@
+import math
+import os
+import wave
+from app.audio import plan_cut_points, split_wav, find_quiet_cut, WAV_HEADER_SIZE
+
+SAMPLE_RATE = 16000
+
+def write_wav(path, seconds, pause_every=None):
+    """A 16-bit mono tone, silent for half a second every pause_every seconds."""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        frames = bytearray()
+        for i in range(seconds * SAMPLE_RATE):
+            t = i / SAMPLE_RATE
+            silent = pause_every and t % pause_every >= pause_every - 0.5
+            sample = 0 if silent else int(8000 * math.sin(2 * math.pi * 220 * t))
+            frames += sample.to_bytes(2, "little", signed=True)
+        wav.writeframes(bytes(frames))
+    return path
+
+def test_cut_points_respect_max_bytes(tmp_path):
+    path = write_wav(str(tmp_path / "report.wav"), 60, pause_every=7)
+    max_bytes = 10 * SAMPLE_RATE * 2 + WAV_HEADER_SIZE  # Ten seconds per segment
+    with wave.open(path, "rb") as wav:
+        cuts = plan_cut_points(wav, max_bytes)
+        total_frames = wav.getnframes()
+    assert cuts[0] == 0 and cuts[-1] == total_frames
+    assert cuts == sorted(cuts)
+    for start, end in zip(cuts, cuts[1:]):
+        assert 0 < (end - start) * 2 + WAV_HEADER_SIZE <= max_bytes
+
+def test_cut_points_prefer_joins(tmp_path):
+    path = write_wav(str(tmp_path / "report.wav"), 30)
+    max_bytes = 10 * SAMPLE_RATE * 2 + WAV_HEADER_SIZE
+    join = 8 * SAMPLE_RATE
+    with wave.open(path, "rb") as wav:
+        cuts = plan_cut_points(wav, max_bytes, joins=[join, 3 * SAMPLE_RATE])
+    assert cuts[1] == join  # Latest join within the search window before the hard cut
+
+def test_short_audio_is_not_split(tmp_path):
+    path = write_wav(str(tmp_path / "report.wav"), 2)
+    with wave.open(path, "rb") as wav:
+        assert plan_cut_points(wav, 10 * 1024 * 1024) == [0, wav.getnframes()]
+
+def test_split_wav_segments_fit(tmp_path):
+    path = write_wav(str(tmp_path / "report.wav"), 45, pause_every=6)
+    max_bytes = 8 * SAMPLE_RATE * 2 + WAV_HEADER_SIZE
+    segments = split_wav(path, max_bytes)
+    assert len(segments) >= 6
+    frames = 0
+    for segment_path, segment_size in segments:
+        assert segment_size == os.path.getsize(segment_path) <= max_bytes
+        with wave.open(segment_path, "rb") as segment:
+            frames += segment.getnframes()
+    assert frames == 45 * SAMPLE_RATE
+
+def test_quiet_cut_ignores_audio_past_end(tmp_path):
+    path = write_wav(str(tmp_path / "report.wav"), 20, pause_every=3)
+    with wave.open(path, "rb") as wav:
+        pcm = wav.readframes(wav.getnframes())
+    end = 10 * SAMPLE_RATE * 2
+    cut = find_quiet_cut(pcm[:end], SAMPLE_RATE)
+    # However much more of the stream is buffered, the cut stays put
+    for extra in (0, 1000, 65536, len(pcm) - end):
+        assert find_quiet_cut(pcm[:end + extra], SAMPLE_RATE, end) == cut
+    assert end - 5 * SAMPLE_RATE * 2 <= cut <= end
+    assert cut % 2 == 0
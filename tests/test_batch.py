@@ -0,0 +1,81 @@
+import io
+import os
+import zipfile
+import pytest
+from fastapi.testclient import TestClient
+import app.api
+import app.storage
+from app.api import extract_archive
+
+def archive(*members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zipped:
+        for name, data in members:
+            zipped.writestr(name, data)
+    return buffer.getvalue()
+
+def scratch_dirs():
+    if not os.path.isdir(app.storage.SCRATCH_DIR):
+        return []
+    return os.listdir(app.storage.SCRATCH_DIR)
+
+def test_extract_archive_skips_non_audio_and_large_members(monkeypatch):
+    monkeypatch.setattr(app.api, "ARCHIVE_MEMBER_MAX_SIZE", 100)
+    data = archive(("a.MP3", b"x" * 50), ("notes.txt", b"text"), ("folder/b.ogg", b"y" * 50), ("big.wav", b"z" * 200))
+    saved, skipped = extract_archive(io.BytesIO(data))
+    assert [name for name, file_path in saved] == ["a.MP3", "folder/b.ogg"]
+    assert skipped == ["notes.txt", "big.wav"]
+    for name, file_path in saved:
+        assert app.storage.in_scratch(file_path) and os.path.exists(file_path)
+    assert file_path.endswith(".ogg")
+
+def test_extract_archive_cleans_up_when_corrupt():
+    data = bytearray(archive(("a.mp3", b"a" * 100), ("b.wav", b"b" * 100)))
+    data[data.find(b"b" * 100)] = ord("c")  # Fails the CRC check of the second member
+    with pytest.raises(zipfile.BadZipFile):
+        extract_archive(io.BytesIO(bytes(data)))
+    assert scratch_dirs() == []
+    assert not app.storage.active
+
+@pytest.fixture
+def client(monkeypatch):
+    queued = []
+
+    def create_jobs(kind, user_id, file_paths):
+        queued.extend(file_paths)
+        return [f"job{index}" for index in range(len(file_paths))]
+
+    monkeypatch.setattr(app.api, "create_jobs", create_jobs)
+    monkeypatch.setattr(app.api.batch_runner, "notify", lambda: None)
+    return TestClient(app.api.app), queued
+
+def test_batch_skips_non_audio_uploads(client):
+    client, queued = client
+    corrupt = bytearray(archive(("a.mp3", b"a" * 100)))
+    corrupt[corrupt.find(b"a" * 100)] = ord("c")
+    response = client.post("/batch", files=[
+        ("files", ("report.OGG", b"ogg")),
+        ("files", ("notes.pdf", b"pdf")),
+        ("files", ("reports.zip", archive(("b.wav", b"wav"), ("readme.md", b"md")))),
+        ("files", ("broken.zip", bytes(corrupt))),
+    ])
+    assert response.status_code == 200
+    body = response.json()
+    assert [job["filename"] for job in body["jobs"]] == ["report.OGG", "b.wav"]
+    assert body["skipped"] == ["notes.pdf", "reports.zip/readme.md", "broken.zip"]
+    assert len(queued) == 2 and len(scratch_dirs()) == 2
+
+def test_failed_batch_removes_its_scratch_files(client, monkeypatch):
+    client, queued = client
+
+    def create_jobs(kind, user_id, file_paths):
+        raise RuntimeError("journal unavailable")
+
+    monkeypatch.setattr(app.api, "create_jobs", create_jobs)
+    response = client.post("/batch", files=[
+        ("files", ("report.ogg", b"ogg")),
+        ("files", ("reports.zip", archive(("b.wav", b"wav")))),
+    ])
+    assert response.status_code == 500
+    assert scratch_dirs() == []
+    assert not app.storage.active
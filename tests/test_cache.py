@@ -0,0 +1,33 @@
+import time
+import app.cache
+from app.cache import get_cached, put_cached
+
+def test_round_trip():
+    assert get_cached("transcript", "sha256:abc") is None
+    put_cached("transcript", "sha256:abc", "متن")
+    assert get_cached("transcript", "sha256:abc") == "متن"
+    assert get_cached("summary", "sha256:abc") is None  # Kinds do not share keys
+
+def test_expired_entries_are_ignored_and_dropped(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    put_cached("summary", "old", "stale")
+    monkeypatch.setattr(time, "time", lambda: now + app.cache.CACHE_TTL_DAYS * 86400 + 1)
+    assert get_cached("summary", "old") is None
+    put_cached("summary", "new", "fresh")
+    conn = app.cache.connect()
+    keys = [row[0] for row in conn.execute("SELECT key FROM cache;")]
+    conn.close()
+    assert keys == ["new"]
+
+def test_least_recently_used_are_evicted(monkeypatch):
+    monkeypatch.setattr(app.cache, "CACHE_MAX_ENTRIES", 2)
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    put_cached("transcript", "a", "1")
+    put_cached("transcript", "b", "2")
+    assert get_cached("transcript", "a") == "1"  # a is now more recent than b
+    put_cached("transcript", "c", "3")
+    assert get_cached("transcript", "b") is None
+    assert get_cached("transcript", "a") == "1"
+    assert get_cached("transcript", "c") == "3"
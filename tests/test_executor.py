@@ -0,0 +1,21 @@
+import asyncio
+import app.executor
+from app.executor import MemoryGate, MB
+
+def test_lone_task_is_always_admitted(monkeypatch):
+    monkeypatch.setattr(app.executor, "mem_available", lambda: 10 * MB)
+    gate = MemoryGate(150 * MB)
+    assert gate.fits(64 * MB)
+
+def test_nested_admission_without_size_does_not_wait(monkeypatch):
+    monkeypatch.setattr(app.executor, "mem_available", lambda: 250 * MB)
+
+    async def scenario():
+        gate = MemoryGate(150 * MB)
+        async with gate.admit(64 * MB):
+            assert not gate.fits(64 * MB)
+            async with gate.admit(0):  # e.g. VAD inside the streaming ffmpeg's reservation
+                assert gate.reserved == 64 * MB
+        assert gate.reserved == 0
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
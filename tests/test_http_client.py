@@ -0,0 +1,89 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timezone
+import httpx
+import pytest
+import app.http_client
+from app.http_client import retry_delay, request_with_retry, stream_with_retry, TokenBucket, RETRY_MAX_DELAY
+
+def response(status, **headers):
+    return httpx.Response(status, headers=headers)
+
+def test_retry_delay_backs_off_exponentially():
+    assert [retry_delay(None, attempt) for attempt in (1, 2, 3, 4)] == [1, 2, 4, 8]
+    assert retry_delay(None, 20) == RETRY_MAX_DELAY
+
+def test_retry_delay_honours_retry_after_seconds():
+    assert retry_delay(response(429, **{"Retry-After": "3.5"}), 1) == 3.5
+    assert retry_delay(response(429, **{"Retry-After": "-4"}), 1) == 0
+    assert retry_delay(response(429, **{"Retry-After": "3600"}), 1) == RETRY_MAX_DELAY
+
+def test_retry_delay_honours_retry_after_date():
+    when = datetime.fromtimestamp(time.time() + 10, timezone.utc)
+    delay = retry_delay(response(503, **{"Retry-After": format_datetime(when, usegmt=True)}), 1)
+    assert 8 <= delay <= 10
+
+def test_retry_delay_ignores_invalid_retry_after():
+    assert retry_delay(response(503, **{"Retry-After": "soon"}), 3) == 4
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Serve requests from a list of canned responses (or exceptions) and record retry sleeps."""
+    replies = []
+    sleeps = []
+
+    def handler(request):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(app.http_client, "client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(app.http_client, "limiters", {"test": TokenBucket(60000)})
+    monkeypatch.setattr(app.http_client.asyncio, "sleep", sleep)
+    return replies, sleeps
+
+def test_request_retries_throttling_and_server_errors(upstream):
+    replies, sleeps = upstream
+    replies.extend([
+        response(429, **{"Retry-After": "7"}),
+        httpx.ConnectError("refused"),
+        response(502),
+        httpx.Response(200, json={"text": "ok"}),
+    ])
+    result = asyncio.run(request_with_retry("test", "POST", "https://upstream.test/v1", attempts=4))
+    assert result.json() == {"text": "ok"}
+    assert sleeps == [7, 2, 4]
+
+def test_request_does_not_retry_client_errors(upstream):
+    replies, sleeps = upstream
+    replies.extend([response(400), response(200)])
+    result = asyncio.run(request_with_retry("test", "POST", "https://upstream.test/v1", attempts=3))
+    assert result.status_code == 400
+    assert sleeps == []
+
+def test_request_gives_up_after_last_attempt(upstream):
+    replies, sleeps = upstream
+    replies.extend([response(503), response(503)])
+    result = asyncio.run(request_with_retry("test", "POST", "https://upstream.test/v1", attempts=2))
+    assert result.status_code == 503
+    assert len(sleeps) == 1
+
+    replies.extend([httpx.ReadTimeout("slow"), httpx.ReadTimeout("slow")])
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(request_with_retry("test", "POST", "https://upstream.test/v1", attempts=2))
+
+def test_stream_retries_before_the_body_is_read(upstream):
+    replies, sleeps = upstream
+    replies.extend([response(429, **{"Retry-After": "1"}), httpx.Response(200, content=b"data: [DONE]\n\n")])
+
+    async def scenario():
+        async with stream_with_retry("test", "POST", "https://upstream.test/v1", attempts=3) as streamed:
+            return streamed.status_code, await streamed.aread()
+
+    assert asyncio.run(scenario()) == (200, b"data: [DONE]\n\n")
+    assert sleeps == [1]
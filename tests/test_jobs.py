@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from app.jobs import JobScheduler, QueueFullError
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_round_robin_across_users():
+    async def scenario():
+        scheduler = JobScheduler(1, 10, 10)
+        order = []
+
+        async def job(name):
+            order.append(name)
+
+        futures = [
+            scheduler.submit("a", job, "a1"),
+            scheduler.submit("a", job, "a2"),
+            scheduler.submit("a", job, "a3"),
+            scheduler.submit("b", job, "b1"),
+        ]
+        await asyncio.gather(*futures)
+        await scheduler.stop()
+        return order
+
+    assert run(scenario()) == ["a1", "b1", "a2", "a3"]
+
+def test_queue_limits():
+    async def scenario():
+        scheduler = JobScheduler(1, 3, 2)
+
+        async def job():
+            pass
+
+        scheduler.submit("a", job)
+        scheduler.submit("a", job)
+        with pytest.raises(QueueFullError):
+            scheduler.submit("a", job)  # Per-user limit
+        scheduler.submit("b", job)
+        with pytest.raises(QueueFullError):
+            scheduler.submit("c", job)  # Global limit
+        scheduler.resume("c", job)  # Resumed jobs skip both
+        assert scheduler.queued == 4
+        await scheduler.stop()
+
+    run(scenario())
+
+def test_results_and_failures_reach_the_future():
+    async def scenario():
+        scheduler = JobScheduler(2, 10, 10)
+
+        async def double(value):
+            return value * 2
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def cancel():
+            raise asyncio.CancelledError()
+
+        doubled = scheduler.submit("a", double, 21)
+        failed = scheduler.submit("a", fail)
+        cancelled = scheduler.submit("a", cancel)
+        assert await doubled == 42
+        with pytest.raises(ValueError):
+            await failed
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        # A job cancelling itself must not take its worker down
+        assert await scheduler.submit("b", double, 1) == 2
+        await scheduler.stop()
+
+    run(scenario())
+
+def test_stop_cancels_running_jobs():
+    async def scenario():
+        scheduler = JobScheduler(1, 10, 10)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+
+        future = scheduler.submit("a", slow)
+        await started.wait()
+        await scheduler.stop()
+        assert future.cancelled()
+        assert scheduler.running == 0
+        # Workers start again on the next submit
+        async def quick():
+            return "ok"
+        assert await scheduler.submit("a", quick) == "ok"
+        await scheduler.stop()
+
+    run(asyncio.wait_for(scenario(), 5))
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import pytest
+import app.pipeline as pipeline
+from app.journal import (
+    create_job, create_jobs, set_stage, save_segment, save_part, finish_job, load_job, unfinished_jobs, unfinished_files
+)
+
+@pytest.fixture
+def report(tmp_path):
+    path = tmp_path / "report.ogg"
+    path.write_bytes(b"OggS" + bytes(1000))
+    return str(path)
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Record calls to the transcription, summarization and database stages instead of making them."""
+    calls = {"transcribed": [], "skipped": None, "summarized": [], "saved": []}
+
+    async def transcript_segments(file_path, skip=()):
+        calls["skipped"] = set(skip)
+        for index, text in enumerate(["یک", "دو", "سه"]):
+            if index not in skip:
+                calls["transcribed"].append(index)
+                yield index, text
+
+    async def summarize(text):
+        calls["summarized"].append(text)
+        return "خلاصه"
+
+    def save(user_id, file_path, transcript, summary):
+        calls["saved"].append(transcript)
+        return 7
+
+    monkeypatch.setattr(pipeline, "iter_transcript_segments", transcript_segments)
+    monkeypatch.setattr(pipeline, "summarize_text", summarize)
+    monkeypatch.setattr(pipeline, "save_report", save)
+    monkeypatch.setattr(pipeline, "SUMMARY_MODE", "single")
+    return calls
+
+def test_unfinished_jobs():
+    queued = create_job("telegram", 1, update_json="{}")
+    running = create_job("telegram", 2)
+    set_stage(running, "summarization", transcript="متن")
+    finished = create_job("telegram", 3)
+    finish_job(finished)
+    failed = create_job("telegram", 4)
+    finish_job(failed, "failed", "boom")
+    create_job("api", 5)
+    assert [job["id"] for job in unfinished_jobs("telegram")] == [queued, running]
+    assert unfinished_jobs("telegram")[1]["stage"] == "summarization"
+
+def test_summarized_batch_jobs_are_not_resumed(tmp_path):
+    first, second = create_jobs("batch", 0, [str(tmp_path / "a.wav"), str(tmp_path / "b.wav")])
+    set_stage(first, "summarized", transcript="متن", summary="خلاصه")
+    assert [job["id"] for job in unfinished_jobs("batch")] == [second]
+    assert sorted(unfinished_files()) == [str(tmp_path / "a.wav"), str(tmp_path / "b.wav")]
+
+def test_finish_job_drops_intermediate_results():
+    job_id = create_job("api", 0)
+    save_segment(job_id, 0, "یک")
+    save_part(job_id, "key", "خلاصه")
+    assert load_job(job_id)["segments"] == {0: "یک"}
+    assert load_job(job_id)["parts"] == {"key": "خلاصه"}
+    finish_job(job_id)
+    job = load_job(job_id)
+    assert job["stage"] == "done"
+    assert job["segments"] == {} and job["parts"] == {}
+
+def test_resume_skips_transcribed_segments(report, upstream):
+    job_id = create_job("api", 0, file_path=report)
+    set_stage(job_id, "transcription")
+    save_segment(job_id, 0, "یک")
+    save_segment(job_id, 1, "دو")
+
+    result = asyncio.run(pipeline.process_report(0, report, job_id=job_id))
+
+    assert upstream["skipped"] == {0, 1}
+    assert upstream["transcribed"] == [2]
+    assert result["transcript"] == "یک دو سه"
+    assert result["report_id"] == 7
+    job = load_job(job_id)
+    assert job["stage"] == "stored" and job["report_id"] == 7
+
+def test_resume_after_transcription_skips_it(report, upstream):
+    job_id = create_job("api", 0, file_path=report)
+    set_stage(job_id, "summarization", transcript="متن کامل")
+
+    result = asyncio.run(pipeline.process_report(0, report, job_id=job_id))
+
+    assert upstream["skipped"] is None  # Transcription never started
+    assert upstream["summarized"] == ["متن کامل"]
+    assert result["summary"] == "خلاصه"
+
+def test_stored_job_is_not_processed_again(report, upstream):
+    job_id = create_job("api", 0, file_path=report)
+    set_stage(job_id, "stored", transcript="متن", summary="خلاصه", report_id=3)
+
+    result = asyncio.run(pipeline.process_report(0, report, job_id=job_id))
+
+    assert result == {"report_id": 3, "transcript": "متن", "summary": "خلاصه"}
+    assert upstream["skipped"] is None and upstream["summarized"] == [] and upstream["saved"] == []
+
+def test_resume_reuses_journaled_part_summaries(report, upstream, monkeypatch):
+    monkeypatch.setattr(pipeline, "SUMMARY_MODE", "map_reduce")
+    summarized_parts = []
+
+    async def summarize_part(text, label):
+        summarized_parts.append(label)
+        return "خلاصه بخش"
+
+    monkeypatch.setattr(pipeline, "summarize_part", summarize_part)
+    job_id = create_job("api", 0, file_path=report)
+    save_segment(job_id, 0, "یک")
+    save_segment(job_id, 1, "دو")
+    for text in ("یک", "دو"):
+        save_part(job_id, hashlib.sha256(text.encode("utf-8")).hexdigest(), f"خلاصه {text}")
+    set_stage(job_id, "summarization", transcript="یک دو")
+
+    asyncio.run(pipeline.process_report(0, report, job_id=job_id))
+
+    assert summarized_parts == []
+    assert upstream["skipped"] is None
+    assert "خلاصه یک" in upstream["summarized"][0] and "خلاصه دو" in upstream["summarized"][0]
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import subprocess
+import pytest
+import app.storage
+from app.storage import DiskQuota, StorageFullError, scratch_file, remove_scratch, retain_original
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    return path
+
+def kept(name, size):
+    return write(os.path.join(app.storage.VOICES_DIR, name), size)
+
+def test_check_counts_scratch_and_kept_files():
+    quota = DiskQuota(1000, 0)
+    asyncio.run(quota.check(900))
+    write(scratch_file(".ogg"), 600)
+    with pytest.raises(StorageFullError):
+        asyncio.run(quota.check(500))
+
+def test_check_evicts_oldest_kept_originals_first():
+    quota = DiskQuota(1000, 0)
+    oldest, newest = kept("old.ogg", 400), kept("new.ogg", 400)
+    os.utime(oldest, (1, 1))
+    asyncio.run(quota.check(500))
+    assert not os.path.exists(oldest)
+    assert os.path.exists(newest)
+
+def test_admit_waits_for_other_reservations(monkeypatch):
+    monkeypatch.setattr(app.storage, "DISK_POLL_INTERVAL", 0.01)
+
+    async def scenario():
+        quota = DiskQuota(1000, 0)
+        order = []
+
+        async def job(name, size, seconds):
+            async with quota.admit(size):
+                order.append(f"{name} started")
+                await asyncio.sleep(seconds)
+            order.append(f"{name} done")
+
+        # A lone job is admitted even beyond the quota, as long as the filesystem has room
+        big = asyncio.create_task(job("big", 5000, 0.05))
+        while not order:
+            await asyncio.sleep(0)
+        await asyncio.gather(big, job("small", 600, 0))
+        assert order == ["big started", "big done", "small started", "small done"]
+        assert quota.reserved == 0
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+def test_admit_gives_up_after_timeout(monkeypatch):
+    monkeypatch.setattr(app.storage, "DISK_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(app.storage, "DISK_WAIT_TIMEOUT", 0.05)
+
+    async def scenario():
+        quota = DiskQuota(1000, 0)
+        async with quota.admit(800):
+            with pytest.raises(StorageFullError):
+                async with quota.admit(800):
+                    pass
+        assert quota.reserved == 0
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+def test_remove_scratch_only_touches_scratch(tmp_path):
+    file_path = write(scratch_file(".ogg"), 10)
+    directory = os.path.dirname(file_path)
+    assert directory in app.storage.active
+    outside = write(str(tmp_path / "elsewhere.ogg"), 10)
+    remove_scratch(outside)
+    remove_scratch(file_path)
+    assert os.path.exists(outside)
+    assert not os.path.exists(directory)
+    assert directory not in app.storage.active
+
+@pytest.mark.parametrize("policy", ["keep", "delete"])
+def test_retain_original(monkeypatch, policy):
+    monkeypatch.setattr(app.storage, "VOICE_RETENTION", policy)
+    file_path = write(scratch_file(".ogg"), 10)
+    kept_path = asyncio.run(retain_original(file_path))
+    if policy == "keep":
+        assert kept_path == os.path.join(app.storage.VOICES_DIR, os.path.basename(file_path))
+        assert os.path.exists(kept_path) and not os.path.exists(file_path)
+    else:
+        assert kept_path is None
+        assert os.path.exists(file_path)  # Goes with the scratch directory
+
+def test_retain_original_keeps_file_when_compression_fails(monkeypatch):
+    monkeypatch.setattr(app.storage, "VOICE_RETENTION", "compress")
+
+    async def failing_ffmpeg(args, **kwargs):
+        raise subprocess.CalledProcessError(1, args, stderr="Unknown encoder 'libopus'")
+
+    monkeypatch.setattr(app.storage, "run_process", failing_ffmpeg)
+    file_path = write(scratch_file(".wav"), 10)
+    kept_path = asyncio.run(retain_original(file_path))
+    assert kept_path == os.path.join(app.storage.VOICES_DIR, os.path.basename(file_path))
+    assert os.path.exists(kept_path)
+
+def test_files_outside_scratch_are_left_alone(tmp_path):
+    file_path = write(str(tmp_path / "resumed.ogg"), 10)
+    assert asyncio.run(retain_original(file_path)) == file_path
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from telegram import Chat, Message, Update
+import app.api
+from app.api import WEBHOOK_PATH
+from app.bot import ChatOrderedUpdateProcessor
+
+def update(update_id, chat_id):
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(chat_id, "private")))
+
+def test_updates_run_in_order_within_a_chat():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(4)
+        handled = []
+
+        async def handle(name, seconds):
+            await asyncio.sleep(seconds)
+            handled.append(name)
+
+        await asyncio.gather(
+            processor.process_update(update(1, 10), handle("a1", 0.05)),
+            processor.process_update(update(2, 10), handle("a2", 0.01)),
+            processor.process_update(update(3, 10), handle("a3", 0)),
+        )
+        assert handled == ["a1", "a2", "a3"]
+        assert processor.chat_locks == {}
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+def test_waiting_updates_do_not_hold_slots():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(2)
+        handled = []
+        release = asyncio.Event()
+
+        async def busy():
+            await release.wait()
+            handled.append("a1")
+
+        async def quick(name):
+            handled.append(name)
+
+        busy_chat = [
+            asyncio.create_task(processor.process_update(update(1, 10), busy())),
+            asyncio.create_task(processor.process_update(update(2, 10), quick("a2"))),
+            asyncio.create_task(processor.process_update(update(3, 10), quick("a3"))),
+        ]
+        await asyncio.sleep(0.01)
+        # One slot is taken by chat 10's running update; its queued ones must leave the other free
+        await asyncio.wait_for(processor.process_update(update(4, 20), quick("b1")), 1)
+        assert handled == ["b1"]
+        release.set()
+        await asyncio.gather(*busy_chat)
+        assert handled == ["b1", "a1", "a2", "a3"]
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+@pytest.fixture
+def webhook(monkeypatch):
+    queue = asyncio.Queue()
+    monkeypatch.setattr(app.api.app.state, "telegram", SimpleNamespace(bot=None, update_queue=queue), raising=False)
+    monkeypatch.setattr(app.api, "WEBHOOK_SECRET", "s3cret")
+    return TestClient(app.api.app), queue
+
+def post(client, body, secret="s3cret"):
+    return client.post(WEBHOOK_PATH, content=body, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+def test_webhook_queues_valid_updates(webhook):
+    client, queue = webhook
+    assert post(client, b'{"update_id": 1}').status_code == 200
+    assert queue.get_nowait().update_id == 1
+
+def test_webhook_rejects_wrong_or_missing_secret(webhook, monkeypatch):
+    client, queue = webhook
+    assert post(client, b'{"update_id": 1}', secret="guess").status_code == 403
+    monkeypatch.setattr(app.api, "WEBHOOK_SECRET", None)
+    assert post(client, b'{"update_id": 1}', secret="").status_code == 403
+    assert queue.empty()
+
+@pytest.mark.parametrize("body", [b"not json", b"[1, 2]", b"{}", b'{"update_id": 1, "message": 5}'])
+def test_webhook_rejects_malformed_updates(webhook, body):
+    client, queue = webhook
+    assert post(client, body).status_code == 400
+    assert queue.empty()
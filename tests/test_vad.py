@@ -0,0 +1,61 @@
+import math
+import wave
+from app.audio import speech_regions, trim_silence, trim_silence_pcm, timestamp_map, VAD_FRAME_MS
+
+SAMPLE_RATE = 16000
+WINDOW = SAMPLE_RATE * VAD_FRAME_MS // 1000
+
+def pcm(*parts):
+    """Mono 16-bit PCM from (seconds, loud) parts: a 220Hz tone when loud, else silence."""
+    samples = bytearray()
+    for seconds, loud in parts:
+        for i in range(int(seconds * SAMPLE_RATE)):
+            sample = int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)) if loud else 0
+            samples += sample.to_bytes(2, "little", signed=True)
+    return bytes(samples)
+
+# 1s speech, a 2s pause that is dropped, 1s speech, a 0.3s pause that is kept, 1s speech
+REPORT = ((1, True), (2, False), (1, True), (0.3, False), (1, True))
+
+def close_to(frames, seconds):
+    return abs(frames - seconds * SAMPLE_RATE) <= WINDOW
+
+def test_speech_regions_bridge_short_pauses_and_pad():
+    loud, quiet = 10 ** 9, 0
+    # Windows 0-9 speech, 10-59 silence (1.5s), 60-69 speech, 70-74 silence (150ms), 75-79 speech
+    energies = [loud] * 10 + [quiet] * 50 + [loud] * 10 + [quiet] * 5 + [loud] * 5
+    total = len(energies) * WINDOW
+    regions = speech_regions(energies, WINDOW, SAMPLE_RATE, total)
+    padding = SAMPLE_RATE * 200 // 1000
+    assert regions == [(0, 10 * WINDOW + padding), (60 * WINDOW - padding, total)]
+
+def test_speech_regions_keep_everything_without_speech():
+    assert speech_regions([], WINDOW, SAMPLE_RATE, 1000) == [(0, 1000)]
+    assert speech_regions([0] * 20, WINDOW, SAMPLE_RATE, 20 * WINDOW) == [(0, 20 * WINDOW)]
+
+def test_trim_silence_pcm_drops_long_pauses():
+    speech, regions = trim_silence_pcm(pcm(*REPORT), SAMPLE_RATE)
+    assert len(regions) == 2
+    (first_start, first_end), (second_start, second_end) = regions
+    assert first_start == 0 and close_to(first_end, 1.2)
+    assert close_to(second_start, 2.8) and second_end == int(5.3 * SAMPLE_RATE)
+    assert len(speech) == sum(end - start for start, end in regions) * 2
+
+def test_trim_silence_matches_in_memory_version(tmp_path):
+    source = pcm(*REPORT)
+    wav_path, out_path = str(tmp_path / "report.wav"), str(tmp_path / "trimmed.wav")
+    with wave.open(wav_path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(source)
+    regions, total_frames = trim_silence(wav_path, out_path)
+    speech, expected_regions = trim_silence_pcm(source, SAMPLE_RATE)
+    assert regions == expected_regions
+    assert total_frames == len(source) // 2
+    with wave.open(out_path, "rb") as trimmed:
+        assert trimmed.readframes(trimmed.getnframes()) == speech
+
+def test_timestamp_map_points_back_to_the_original():
+    regions = [(0, 100), (300, 450)]
+    assert timestamp_map(regions) == [(0, 0, 100), (100, 300, 150)]